@@ -1,10 +1,19 @@
 import argparse
 import os
+import sys
 import shutil
 import cv2
 import numpy as np
 import csv
+import hashlib
+import json
+import importlib.util
+import threading
+import time
 import ffmpeg
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import stage_profiler
 
 
 # === User's Configuration ===
@@ -37,6 +46,43 @@ GAP_DURATION_THRESHOLD = 0.35  # seconds
 # 幻灯片提取的偏移量（默认值：+2）
 SLIDES_OFFSET = +2
 
+# Number of segments handed to each worker when --workers is used (default: 4)
+# 使用 --workers 时，每个进程分到的视频分段数（默认值：4）
+SEGMENTS_PER_WORKER = 4
+
+# Save a checkpoint of the similarity trace cache every N frames (default: 3000)
+# 每隔 N 帧保存一次相似度缓存的断点（默认值：3000）
+CHECKPOINT_FRAMES = 3000
+
+# Tolerance of the ROI change gate: 0 reuses the previous similarity only when the icon region is
+# pixel-identical, N > 0 also when its 16x16 thumbnail differs by at most N grey levels (default: 0)
+# ROI 变化检测的容差：0 表示仅在黑百合区域逐像素相同时沿用上一帧的相似度，
+# N > 0 表示其 16x16 缩略图的差异不超过 N 个灰度级时也沿用（默认值：0）
+ROI_GATE_TOLERANCE = 0
+
+# Threads and maximum number of pending images of the background image writer (default: 4 / 64)
+# 后台图片写入的线程数与最大排队图片数（默认值：4 / 64）
+IMAGE_WRITER_THREADS = 4
+IMAGE_WRITER_QUEUE = 64
+
+# Slide deduplication: maximum Hamming distance between the 64-bit perceptual hashes of two slides
+# for them to be compared, and the similarity they must then reach to count as the same line
+# (default: 8 / 0.996)
+# 幻灯片去重：两张幻灯片的 64 位感知哈希的最大汉明距离（在此范围内才进一步比较），
+# 以及比较时被视为同一句台词所需的相似度（默认值：8 / 0.996）
+SLIDE_HASH_DISTANCE = 8
+SLIDE_DEDUPE_THRESHOLD = 0.996
+
+# Slide crops held in memory during a (non-streaming) scan; beyond that, the candidates least likely
+# to start an interval keep only their frame number and their slides are read back by seeking (default: 32)
+# 扫描（非流式模式）时在内存中保留的幻灯片裁切图数量上限；超过时，最不可能是字幕开始帧的候选帧只记录帧号，
+# 其幻灯片在扫描结束后通过定位读取（默认值：32）
+SLIDE_CROP_LIMIT = 32
+
+# Slides waiting for OCR in the fused pipeline (--ocr) before scanning pauses (default: 8)
+# 融合流水线（--ocr）中等待 OCR 的幻灯片数量上限，超过时暂停扫描（默认值：8）
+OCR_QUEUE_SIZE = 8
+
 # === User's Configuration End ===
 
 # ASS Header Template (From your reference script)
@@ -128,16 +174,80 @@ CONFIG_PRESETS = {
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Extract frames from video, apply sharpening, binarization, compute similarity with reference image, and generate subtitles.")
-    parser.add_argument("--input", type=str, required=True,
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument("--input", type=str,
                         help="Path to the input video file.")
+    inputs.add_argument("--input-dir", type=str,
+                        help="Batch mode: process every video in this directory.")
+    inputs.add_argument("--manifest", type=str,
+                        help="Batch mode: process the videos listed in this text file, one path per line "
+                             "(relative paths are resolved against the manifest's directory).")
     parser.add_argument("--debug", action="store_true",
                         help="Enable debug mode to save tmp_frame images.")
+    parser.add_argument("--debug-archive", action="store_true",
+                        help="Debug mode, but store all processed regions in one compressed "
+                             "tmp_debug_frame/_a.npz instead of one PNG per frame.")
     parser.add_argument("--slides", action="store_true",
                         help="Enable slides generation for high similarity intervals.")
     parser.add_argument("--enable-merge", action="store_true",
                         help="Enable merging of similar slides.")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="With --slides, find slides that repeat an earlier line and record them in "
+                             "<video>-slides/_dedupe.json so 03_ocr.py recognizes each line only once.")
+    parser.add_argument("--hash-index", type=str, default=None,
+                        help="Slide hash index file shared across episodes; implies --dedupe and also "
+                             "matches slides against lines of previously processed episodes.")
     parser.add_argument("--ass", action="store_true",
                         help="Generate .ass subtitle file alongside .srt.")
+    parser.add_argument("--decoder", choices=DECODER_BACKENDS, default="opencv",
+                        help="Decoder backend for the yuri region: 'opencv' decodes full BGR frames, "
+                             "'ffmpeg' streams only the cropped grayscale region through a rawvideo pipe.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes scanning keyframe-aligned segments of the video in parallel.")
+    parser.add_argument("--stride", type=int, default=1,
+                        help="Coarse-to-fine scanning: only sample every N-th frame and rescan around on/off transitions. "
+                             "Matches a full scan exactly only with --threshold.")
+    parser.add_argument("--max-stride", type=int, default=None,
+                        help="Let the stride grow up to this many frames while the icon stays off. "
+                             "Must stay below the length of the shortest dialogue line.")
+    parser.add_argument("--detect-scale", type=float, default=1.0,
+                        help="Run icon detection on a stream downscaled by this factor (e.g. 0.5). "
+                             "Slides still come from full-resolution frames.")
+    parser.add_argument("--scale-report", type=float, nargs="+", default=None, metavar="SCALE",
+                        help="Compare the similarity traces at these detection scales with the "
+                             "full-resolution trace and exit.")
+    parser.add_argument("--no-roi-gate", action="store_true",
+                        help="Run sharpening, binarization and comparison on every frame, even when the "
+                             "icon region is unchanged from the previous frame.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not read or write the <video>.trace.npz similarity trace cache.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Batch mode: number of videos processed in parallel.")
+    parser.add_argument("--force", action="store_true",
+                        help="Batch mode: also process videos whose outputs are newer than the video.")
+    parser.add_argument("--profile", nargs="?", const=True, default=None, metavar="JSON",
+                        help="Record wall time, calls and peak memory per processing stage, print a summary "
+                             "and write it as JSON (default: <video>.profile.json next to the input).")
+    parser.add_argument("--stream", action="store_true",
+                        help="Detect intervals in one forward pass with bounded memory and write each "
+                             "subtitle as soon as it is final. Needs --threshold or --warmup-frames.")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="Absolute similarity threshold for peak frames (default: max * THRESHOLD_RATIO "
+                             "of the whole trace; streaming mode needs it or --warmup-frames).")
+    parser.add_argument("--warmup-frames", type=int, default=0,
+                        help="Streaming mode: calibrate the threshold as max * THRESHOLD_RATIO "
+                             "over the first N frames.")
+    parser.add_argument("--ocr", action="store_true",
+                        help="Streaming mode: recognize each slide with 03_ocr.py's OCR while the video is "
+                             "still being scanned, write the text into the subtitles and <video>-ocr-results.csv. "
+                             "Slide PNGs are only written with --slides.")
+    parser.add_argument("--chn", action="store_true",
+                        help="With --ocr: also translate the recognized text to Chinese.")
+    parser.add_argument("--raw-size", type=str, default=None,
+                        help="Streaming mode: read raw bgr24 frames of this size (e.g. 1080x1920) "
+                             "from --input, where '-' means stdin.")
+    parser.add_argument("--raw-fps", type=float, default=None,
+                        help="Streaming mode: frame rate of the raw input.")
     return parser.parse_args()
 
 
@@ -159,7 +269,8 @@ def enhance_sharpness(image):
 
 
 def binarize_image(image):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    # The ffmpeg decoder backend already delivers grayscale regions
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
     _, binary = cv2.threshold(
         gray, 128, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
     return binary
@@ -186,10 +297,1219 @@ def get_video_resolution(video_path):
     return None, None
 
 
-def extract_frames(video_path, debug, slides, enable_merge, generate_ass):
+def preset_regions(preset, frame_width, frame_height):
+    """
+    Return the pixel boxes (x1, y1, x2, y2) of the yuri region and the slide region.
+    """
+    x1, y1 = int(preset["YURI_X1_RATIO"] *
+                 frame_width), int(preset["YURI_Y1_RATIO"] * frame_height)
+    x2, y2 = int(preset["YURI_X2_RATIO"] *
+                 frame_width), int(preset["YURI_Y2_RATIO"] * frame_height)
+    x1_s, y1_s = int(preset["SLIDE_X1_RATIO"] *
+                     frame_width), int(preset["SLIDE_Y1_RATIO"] * frame_height)
+    x2_s, y2_s = int(preset["SLIDE_X2_RATIO"] *
+                     frame_width), int(preset["SLIDE_Y2_RATIO"] * frame_height)
+    return (x1, y1, x2, y2), (x1_s, y1_s, x2_s, y2_s)
+
+
+def detection_region(preset, frame_width, frame_height, scale=1.0):
+    """
+    Return (roi, detect_size) for running detection on a stream downscaled by scale.
+    roi is the full-resolution box that corresponds to the preset ROI of the scaled
+    frame, and detect_size the (width, height) it is shrunk to, or None at full resolution.
+    """
+    if scale >= 1:
+        return preset_regions(preset, frame_width, frame_height)[0], None
+    scaled_roi, _ = preset_regions(preset, int(frame_width * scale), int(frame_height * scale))
+    x1, y1, x2, y2 = scaled_roi
+    roi = (int(round(x1 / scale)), int(round(y1 / scale)),
+           min(frame_width, int(round(x2 / scale))), min(frame_height, int(round(y2 / scale))))
+    return roi, (x2 - x1, y2 - y1)
+
+
+def shrink_roi(yuri_area, detect_size=None):
+    if detect_size is None:
+        return yuri_area
+    return cv2.resize(yuri_area, detect_size, interpolation=cv2.INTER_AREA)
+
+
+def read_roi_frames_opencv(video_path, roi, start_frame=0, start_time=0.0, num_frames=None, slide_roi=None,
+                           detect_size=None):
+    """
+    Yield (roi, slide) pairs of BGR regions for every frame, decoded by OpenCV.
+    The slide region is None unless slide_roi is given; the roi is shrunk to
+    detect_size when reduced-resolution detection is requested.
+    When start_frame is given, decoding starts there (it should be a keyframe)
+    and at most num_frames frames are produced.
+    """
+    x1, y1, x2, y2 = roi
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    read_count = 0
+    try:
+        while num_frames is None or read_count < num_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if start_frame and read_count == 0:
+                # Refuse to continue if the seek did not land on the expected frame
+                position = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                if abs(position - start_time) * fps >= 0.5:
+                    print(f"Warning: Seek to frame {start_frame} landed at {position:.3f}s "
+                          f"instead of {start_time:.3f}s.")
+                    break
+            slide_area = None
+            if slide_roi is not None:
+                x1_s, y1_s, x2_s, y2_s = slide_roi
+                slide_area = frame[y1_s:y2_s, x1_s:x2_s]
+            yield shrink_roi(frame[y1:y2, x1:x2], detect_size), slide_area
+            read_count += 1
+    finally:
+        cap.release()
+
+
+def _read_ffmpeg_crops(video_path, roi, pix_fmt, channels, start_frame=0, start_time=0.0, num_frames=None,
+                       detect_size=None):
+    """
+    Yield one region of every frame, cropped (and optionally shrunk to detect_size)
+    and converted to pix_fmt inside ffmpeg.
+    """
+    x1, y1, x2, y2 = roi
+    width, height = x2 - x1, y2 - y1
+    out_width, out_height = detect_size or (width, height)
+    shape = (out_height, out_width, channels) if channels > 1 else (out_height, out_width)
+    frame_size = out_width * out_height * channels
+    input_args = {"ss": start_time} if start_frame else {}
+    output_args = {"vframes": num_frames} if num_frames is not None else {}
+    stream = ffmpeg.input(video_path, **input_args)
+    if pix_fmt == "gray":
+        stream = stream.filter("crop", width, height, x1, y1, exact=1)
+        if detect_size:
+            stream = stream.filter("scale", out_width, out_height, flags="area")
+    else:
+        # Convert a slightly larger, chroma-aligned region first so colours match
+        # OpenCV's full-frame conversion pixel for pixel
+        outer_x1, outer_y1 = max(0, (x1 - 4) // 2 * 2), max(0, (y1 - 4) // 2 * 2)
+        outer_x2, outer_y2 = (x2 + 5) // 2 * 2, (y2 + 5) // 2 * 2
+        stream = (
+            stream
+            .filter("crop", f"min({outer_x2 - outer_x1},iw-{outer_x1})",
+                    f"min({outer_y2 - outer_y1},ih-{outer_y1})", outer_x1, outer_y1)
+            .filter("format", pix_fmt)
+            .filter("crop", width, height, x1 - outer_x1, y1 - outer_y1)
+        )
+    process = (
+        stream
+        .output("pipe:", format="rawvideo", pix_fmt=pix_fmt, vsync="passthrough", **output_args)
+        .global_args("-loglevel", "error")
+        .run_async(pipe_stdout=True)
+    )
+    try:
+        while True:
+            buffer = process.stdout.read(frame_size)
+            if len(buffer) < frame_size:
+                break
+            yield np.frombuffer(buffer, np.uint8).reshape(shape)
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+def read_roi_frames_ffmpeg(video_path, roi, start_frame=0, start_time=0.0, num_frames=None, slide_roi=None,
+                           detect_size=None):
+    """
+    Yield (roi, slide) pairs for every frame: the grayscale region of interest (shrunk
+    to detect_size if given) and, if slide_roi is given, the BGR slide region (otherwise None).
+    Cropping and colour conversion happen inside ffmpeg, so only the small
+    regions travel through rawvideo pipes instead of full BGR frames.
+    Segments are selected with an accurate seek to start_time.
+    """
+    yuri_frames = _read_ffmpeg_crops(video_path, roi, "gray", 1, start_frame, start_time, num_frames,
+                                     detect_size)
+    if slide_roi is None:
+        for yuri_area in yuri_frames:
+            yield yuri_area, None
+        return
+    slide_frames = _read_ffmpeg_crops(video_path, slide_roi, "bgr24", 3, start_frame, start_time, num_frames)
+    try:
+        yield from zip(yuri_frames, slide_frames)
+    finally:
+        yuri_frames.close()
+        slide_frames.close()
+
+
+DECODER_BACKENDS = {
+    "opencv": read_roi_frames_opencv,
+    "ffmpeg": read_roi_frames_ffmpeg,
+}
+
+
+def read_roi_frames_raw(stream, frame_width, frame_height, roi, slide_roi=None, detect_size=None):
+    """
+    Yield (roi, slide) pairs from a stream of raw bgr24 frames, e.g. stdin fed by
+    `ffmpeg ... -f rawvideo -pix_fmt bgr24 -` or a named pipe.
+    """
+    x1, y1, x2, y2 = roi
+    frame_bytes = frame_width * frame_height * 3
+    while True:
+        frame = np.empty((frame_height, frame_width, 3), np.uint8)
+        view = memoryview(frame.reshape(-1))
+        filled = 0
+        while filled < frame_bytes:
+            read_size = stream.readinto(view[filled:])
+            if not read_size:
+                return
+            filled += read_size
+        slide_area = None
+        if slide_roi is not None:
+            x1_s, y1_s, x2_s, y2_s = slide_roi
+            slide_area = frame[y1_s:y2_s, x1_s:x2_s]
+        yield shrink_roi(frame[y1:y2, x1:x2], detect_size), slide_area
+
+
+class SimilarityEngine:
+    """
+    Batched version of compute_similarity for a stream of equally sized regions.
+    The reference image is resized once, binarized regions are collected into a
+    preallocated (N, h, w) uint8 batch, and each full batch is compared in one
+    vectorized operation. Results are identical to calling compute_similarity per frame.
+    """
+
+    def __init__(self, reference_image, batch_size=256):
+        self.reference_image = reference_image
+        self.batch_size = batch_size
+        self.batch = None
+        self.count = 0
+
+    def _allocate(self, shape):
+        height, width = shape
+        reference_resized = cv2.resize(self.reference_image, (width, height))
+        self.batch = np.empty((self.batch_size, height, width), np.uint8)
+        self.diff = np.empty((self.batch_size * height, width), np.uint8)
+        self.reference_stack = np.tile(reference_resized, (self.batch_size, 1))
+        self.scale = 255 * height * width
+
+    def add(self, binary_image):
+        """
+        Queue one binarized region; returns True when the batch is full and should be flushed.
+        """
+        if self.batch is None:
+            self._allocate(binary_image.shape)
+        self.batch[self.count] = binary_image
+        self.count += 1
+        return self.count == self.batch_size
+
+    def flush(self):
+        """
+        Compute the similarities of all queued regions, in order.
+        """
+        if not self.count:
+            return []
+        height, width = self.batch.shape[1:]
+        rows = self.count * height
+        stacked = self.batch[:self.count].reshape(rows, width)
+        cv2.absdiff(stacked, self.reference_stack[:rows], dst=self.diff[:rows])
+        sums = self.diff[:rows].reshape(self.count, -1).sum(axis=1, dtype=np.uint64)
+        self.count = 0
+        return (1 - (sums / self.scale)).tolist()
+
+
+class RoiChangeGate:
+    """
+    Cheap change gate on the raw region of interest. While the region stays unchanged,
+    the binarized image and similarity of the last processed frame are reused instead of
+    sharpening, binarizing and comparing it again. With tolerance 0 the region must be
+    pixel-identical, so the trace is unaffected; a positive tolerance compares 16x16
+    thumbnails against the last processed frame, which prevents slow drifts from accumulating.
+    """
+
+    THUMBNAIL_SIZE = (16, 16)
+
+    def __init__(self, tolerance=0):
+        self.tolerance = tolerance
+        self.anchor = None
+        self.binary = None
+        self.frames = 0
+        self.hits = 0
+
+    def _signature(self, yuri_area):
+        if not self.tolerance:
+            return yuri_area.copy()
+        return cv2.resize(yuri_area, self.THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def unchanged(self, yuri_area):
+        """
+        Return True if yuri_area can reuse the result of the last processed frame.
+        """
+        self.frames += 1
+        if self.anchor is not None:
+            if not self.tolerance:
+                hit = np.array_equal(yuri_area, self.anchor)
+            else:
+                thumbnail = self._signature(yuri_area)
+                hit = thumbnail.shape == self.anchor.shape and \
+                    int(np.abs(thumbnail - self.anchor).max()) <= self.tolerance
+            if hit:
+                self.hits += 1
+                return True
+        self.anchor = self._signature(yuri_area)
+        return False
+
+    def merge(self, counts):
+        frames, hits = counts
+        self.frames += frames
+        self.hits += hits
+
+    def counts(self):
+        return self.frames, self.hits
+
+    def report(self):
+        if self.frames:
+            print(f"ROI gate: reused {self.hits} of {self.frames} frames "
+                  f"({self.hits / self.frames:.1%}), tolerance {self.tolerance}")
+
+
+class SlideCollector:
+    """
+    Capture slide crops during the main scan so slides need no second pass over the video.
+    An interval can only start on a frame whose similarity rose above the previous frame's,
+    which requires its binarized icon region to change. Crops are kept for those candidate
+    frames alone (at SLIDES_OFFSET, via a small ring buffer of recent slide regions) and
+    dropped once the candidate's similarity rules it out.
+
+    Once the detector's peak_threshold is known (an absolute threshold, or one calibrated on
+    warm-up frames), a candidate must cross it: previous frame below, this frame at or above.
+    Until then it must reach THRESHOLD_RATIO of the running maximum, which never exceeds the
+    final max * THRESHOLD_RATIO. With max_crops, at most that many candidates keep a crop;
+    past it the one with the highest previous similarity (the least likely to start a run)
+    loses its crop, and its slide has to be read back by seeking. crowded() asks the scan to
+    resolve early so frames with unknown similarity do not pile up crops either.
+    """
+
+    def __init__(self, fps, peak_threshold=None, max_crops=None):
+        self.fps = fps
+        self.peak_threshold = peak_threshold
+        self.max_crops = max_crops
+        self.recent = deque(maxlen=max(0, -SLIDES_OFFSET) + 2)
+        self.pending = {}
+        self.unresolved = {}
+        # frame -> (similarity, previous similarity, slide target)
+        self.candidates = {}
+        self.crops = {}
+        self.previous_binary = None
+        self.previous_similarity = None
+        self.running_max = 0.0
+        self.evicted = 0
+
+    def slide_target(self, frame_count):
+        # Same expression as the slide extraction block, including its float rounding
+        return SLIDES_OFFSET + int((frame_count / self.fps) * self.fps)
+
+    def observe(self, frame_count, yuri_binary, slide_area):
+        """
+        Record one decoded frame, before its similarity is known.
+        """
+        self.recent.append((frame_count, slide_area))
+        if self.pending.pop(frame_count, None) is not None:
+            self.crops[frame_count] = slide_area.copy()
+
+        changed = self.previous_binary is None or not np.array_equal(yuri_binary, self.previous_binary)
+        self.previous_binary = yuri_binary
+        if not changed:
+            return
+        target = self.slide_target(frame_count)
+        self.unresolved[frame_count] = target
+        if target > frame_count:
+            self.pending[target] = frame_count
+        else:
+            for recent_frame, recent_slide in self.recent:
+                if recent_frame == target:
+                    self.crops[target] = recent_slide.copy()
+
+    def resolve(self, first_frame, similarities):
+        """
+        Feed the similarities of consecutive frames starting at first_frame, once they are computed.
+        """
+        for frame_count, similarity in enumerate(similarities, start=first_frame):
+            previous_similarity = self.previous_similarity
+            self.previous_similarity = similarity
+            if similarity > self.running_max:
+                self.running_max = similarity
+                if self.peak_threshold is None:
+                    self._prune()
+            target = self.unresolved.pop(frame_count, None)
+            if target is None:
+                continue
+            if ((previous_similarity is None or similarity > previous_similarity)
+                    and self._may_start(similarity, previous_similarity)):
+                self.candidates[frame_count] = (similarity, previous_similarity, target)
+                if self.max_crops is not None:
+                    self._evict()
+            else:
+                self._discard(target)
+
+    def crowded(self):
+        return self.max_crops is not None and len(self.unresolved) >= self.max_crops
+
+    def set_peak_threshold(self, peak_threshold):
+        """
+        Switch to the detector's threshold once it is known, dropping the candidates it rules out.
+        """
+        self.peak_threshold = peak_threshold
+        self._prune()
+
+    def _may_start(self, similarity, previous_similarity):
+        if self.peak_threshold is None:
+            return similarity >= self.running_max * THRESHOLD_RATIO
+        return similarity >= self.peak_threshold and (previous_similarity is None
+                                                      or previous_similarity < self.peak_threshold)
+
+    def _prune(self):
+        for frame_count, (similarity, previous_similarity, target) in list(self.candidates.items()):
+            if not self._may_start(similarity, previous_similarity):
+                del self.candidates[frame_count]
+                self._discard(target)
+
+    def _evict(self):
+        with_crops = [(previous_similarity if previous_similarity is not None else -1.0, frame_count)
+                      for frame_count, (_, previous_similarity, target) in self.candidates.items()
+                      if target in self.crops]
+        if len(with_crops) > self.max_crops:
+            _, frame_count = max(with_crops)
+            self.crops.pop(self.candidates[frame_count][2])
+            self.evicted += 1
+
+    def _discard(self, target):
+        self.crops.pop(target, None)
+        self.pending.pop(target, None)
+
+    def release(self, end_frame):
+        """
+        Forget the candidates up to end_frame once their interval has been written.
+        """
+        for frame_count in [frame for frame in self.candidates if frame <= end_frame]:
+            self._discard(self.candidates.pop(frame_count)[2])
+
+    def slide_crops(self):
+        """
+        Return {frame_target: slide crop} for every remaining candidate that kept its crop.
+        """
+        return {target: self.crops[target] for _, _, target in self.candidates.values()
+                if target in self.crops}
+
+
+def compute_frame_similarities(roi_frames, reference_image, first_frame=0, debug_sink=None,
+                               slide_collector=None, checkpoint=None, gate=None):
+    """
+    Sharpen, binarize and compare every region of interest with the reference image.
+    Returns the similarity trace as a float64 array indexed by frame - first_frame.
+    checkpoint, if given, is called with the trace so far every CHECKPOINT_FRAMES frames.
+    gate, a RoiChangeGate, lets frames with an unchanged region reuse the previous similarity.
+    """
+    engine = SimilarityEngine(reference_image)
+    similarities = []
+    # One entry per frame since the last flush: True if the engine computes it, False if reused
+    computed = []
+    next_checkpoint = CHECKPOINT_FRAMES
+
+    def flush():
+        nonlocal next_checkpoint
+        with stage_profiler.stage("SimilarityEngine.flush"):
+            results = iter(engine.flush())
+        batch = []
+        for is_computed in computed:
+            batch.append(next(results) if is_computed else (batch[-1] if batch else similarities[-1]))
+        computed.clear()
+        if slide_collector is not None:
+            with stage_profiler.stage("SlideCollector.resolve"):
+                slide_collector.resolve(first_frame + len(similarities), batch)
+        similarities.extend(batch)
+        if checkpoint is not None and len(similarities) >= next_checkpoint:
+            checkpoint(similarities)
+            next_checkpoint += CHECKPOINT_FRAMES
+
+    roi_frames = stage_profiler.iterate("decode", roi_frames)
+    for frame_count, (yuri_area, slide_area) in enumerate(roi_frames, start=first_frame):
+        with stage_profiler.stage("RoiChangeGate.unchanged"):
+            unchanged = gate is not None and gate.unchanged(yuri_area)
+        if unchanged:
+            yuri_binary = gate.binary
+            save_debug_roi(yuri_binary, frame_count, debug_sink)
+            computed.append(False)
+            full = len(computed) == engine.batch_size
+        else:
+            yuri_binary = prepare_roi(yuri_area, frame_count, debug_sink)
+            if gate is not None:
+                gate.binary = yuri_binary
+            computed.append(True)
+            full = engine.add(yuri_binary) or len(computed) == engine.batch_size
+        if slide_collector is not None:
+            with stage_profiler.stage("SlideCollector.observe"):
+                slide_collector.observe(frame_count, yuri_binary, slide_area)
+                full = full or slide_collector.crowded()
+        if full:
+            flush()
+    flush()
+    return np.array(similarities, dtype=np.float64)
+
+
+def prepare_roi(yuri_area, frame_count, debug_sink=None):
+    """
+    Sharpen and binarize one region of interest.
+    """
+    with stage_profiler.stage("enhance_sharpness"):
+        yuri_sharpened = enhance_sharpness(yuri_area)
+    with stage_profiler.stage("binarize_image"):
+        yuri_binary = binarize_image(yuri_sharpened)
+    save_debug_roi(yuri_binary, frame_count, debug_sink)
+    return yuri_binary
+
+
+def save_debug_roi(yuri_binary, frame_count, debug_sink=None):
+    if debug_sink is not None:
+        # Save processed frame for debugging
+        with stage_profiler.stage("save_debug_roi"):
+            debug_sink.save(frame_count, yuri_binary)
+
+
+class ImageWriter:
+    """
+    Write images from a small thread pool so PNG encoding and file I/O stay off the scanning loop.
+    At most queue_size images are pending at a time; write() blocks while the queue is full.
+    """
+
+    def __init__(self, threads=IMAGE_WRITER_THREADS, queue_size=IMAGE_WRITER_QUEUE):
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.queue_size = queue_size
+        self.pending = {}
+        self.failed = []
+
+    def _write(self, path, image):
+        try:
+            with stage_profiler.stage("ImageWriter.imwrite"):
+                written = cv2.imwrite(path, image)
+            if not written:
+                self.failed.append(path)
+        except cv2.error:
+            self.failed.append(path)
+        finally:
+            self.slots.release()
+
+    def write(self, path, image):
+        """
+        Queue image to be written to path. The image must not be modified afterwards.
+        """
+        self.slots.acquire()
+        if len(self.pending) > 4 * self.queue_size:
+            self.pending = {key: future for key, future in self.pending.items() if not future.done()}
+        self.pending[path] = self.executor.submit(self._write, path, image)
+
+    def wait(self, path):
+        """
+        Block until a queued write to path, if any, has finished.
+        """
+        future = self.pending.pop(path, None)
+        if future is not None:
+            future.result()
+
+    def close(self):
+        with stage_profiler.stage("ImageWriter.close"):
+            self.executor.shutdown(wait=True)
+        self.pending.clear()
+        if self.failed:
+            print(f"Warning: Failed to write {len(self.failed)} images, e.g. {self.failed[0]}")
+
+
+class DebugFrameSink:
+    """
+    Destination of the processed debug regions. By default every region becomes one PNG in
+    directory, written by an ImageWriter. In archive mode, regions are collected into compressed
+    .npz parts of PART_FRAMES frames, which finish() combines into a single _a.npz holding the
+    frame numbers, regions and similarity trace. Only the directory and mode are pickled, so
+    every worker process gets its own writer and parts.
+    """
+
+    PART_FRAMES = 3000
+
+    def __init__(self, directory, archive=False):
+        self.directory = directory
+        self.archive = archive
+        self._reset()
+
+    def _reset(self):
+        self.image_writer = None
+        self.frames = []
+        self.rois = []
+        self.part_count = 0
+
+    def __getstate__(self):
+        return {"directory": self.directory, "archive": self.archive}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def save(self, frame_count, yuri_binary):
+        if self.archive:
+            self.frames.append(frame_count)
+            self.rois.append(yuri_binary)
+            if len(self.frames) >= self.PART_FRAMES:
+                self._write_part()
+            return
+        if self.image_writer is None:
+            self.image_writer = ImageWriter()
+        self.image_writer.write(os.path.join(self.directory, f"{frame_count:06d}.png"), yuri_binary)
+
+    def _write_part(self):
+        if not self.frames:
+            return
+        part_path = os.path.join(self.directory, f"_part-{self.frames[0]:06d}-{os.getpid()}-{self.part_count:04d}.npz")
+        np.savez_compressed(part_path, frames=np.array(self.frames, dtype=np.int64), rois=np.stack(self.rois))
+        self.part_count += 1
+        self.frames, self.rois = [], []
+
+    def close(self):
+        """
+        Flush everything this process has saved so far.
+        """
+        if self.archive:
+            self._write_part()
+        elif self.image_writer is not None:
+            self.image_writer.close()
+            self.image_writer = None
+
+    def finish(self, similarities=None):
+        """
+        Combine the archive parts of all processes into _a.npz. Call close() first.
+        """
+        if not self.archive:
+            return
+        part_paths = sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                            if name.startswith("_part-") and name.endswith(".npz"))
+        frames, rois = [], []
+        for part_path in part_paths:
+            with np.load(part_path) as part:
+                frames.append(part["frames"])
+                rois.append(part["rois"])
+        archive = {}
+        if frames:
+            # Frames revisited by the stride scan are identical, keep the first copy
+            frames, unique = np.unique(np.concatenate(frames), return_index=True)
+            archive["frames"] = frames
+            archive["rois"] = np.concatenate(rois)[unique]
+        if similarities is not None:
+            archive["similarities"] = np.asarray(similarities, dtype=np.float64)
+        np.savez_compressed(os.path.join(self.directory, "_a.npz"), **archive)
+        for part_path in part_paths:
+            os.remove(part_path)
+
+
+def roi_similarity(yuri_area, reference_image, frame_count, debug_sink=None):
+    """
+    Sharpen and binarize one region of interest, then compare it with the reference image.
+    """
+    yuri_binary = prepare_roi(yuri_area, frame_count, debug_sink)
+    with stage_profiler.stage("compute_similarity"):
+        return compute_similarity(yuri_binary, reference_image)
+
+
+def scan_similarities_strided(video_path, roi, reference_image, stride, max_stride, debug_sink=None,
+                              detect_size=None, peak_threshold=None):
+    """
+    Coarse-to-fine scan with OpenCV.
+    The coarse pass retrieves every stride-th frame and skips the others with grab(); the
+    stride doubles (up to max_stride) while the icon stays off. Windows between two samples
+    whose on/off state differs are then rescanned densely, so interval boundaries are
+    frame-accurate against the final threshold. Frames between two samples in the same state
+    inherit the earlier sample's similarity. On/off is judged against peak_threshold if given,
+    otherwise against max * THRESHOLD_RATIO of everything computed so far. That maximum can
+    miss the peak of a skipped frame, leaving the threshold slightly below a full scan's; a
+    boundary frame scoring between the two then moves its interval by a frame, so only
+    peak_threshold gives the full scan's intervals exactly.
+    """
+    x1, y1, x2, y2 = roi
+    cap = cv2.VideoCapture(video_path)
+
+    # Coarse pass
+    samples = []
+    frame_number = 0
+    next_sample = 0
+    current_stride = stride
+    running_max = 0.0
+    while True:
+        if frame_number == next_sample:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            similarity = roi_similarity(shrink_roi(frame[y1:y2, x1:x2], detect_size), reference_image,
+                                        frame_number, debug_sink)
+            samples.append((frame_number, similarity))
+            running_max = max(running_max, similarity)
+            if similarity < (peak_threshold if peak_threshold is not None else running_max * THRESHOLD_RATIO):
+                current_stride = min(current_stride * 2, max_stride)
+            else:
+                current_stride = stride
+            next_sample = frame_number + current_stride
+        elif not cap.grab():
+            break
+        frame_number += 1
+    total_frames = frame_number
+    if not samples:
+        cap.release()
+        return np.empty(0, dtype=np.float64)
+
+    dense = dict(samples)
+    position = total_frames
+
+    def read_window(start, end):
+        # Densely compute frames [start, end) that are not known yet
+        nonlocal position
+        if start != position:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+            position = start
+        while position < end:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if position not in dense:
+                dense[position] = roi_similarity(
+                    shrink_roi(frame[y1:y2, x1:x2], detect_size), reference_image, position, debug_sink)
+            position += 1
+
+    # The tail after the last sample is never covered by a pair of samples
+    read_window(samples[-1][0] + 1, total_frames)
+
+    # Refine until the threshold derived from everything computed so far is stable
+    refined = set()
+    while True:
+        on_threshold = peak_threshold if peak_threshold is not None else max(dense.values()) * THRESHOLD_RATIO
+        windows = [(a + 1, b) for (a, sim_a), (b, sim_b) in zip(samples, samples[1:])
+                   if b - a > 1 and (sim_a >= on_threshold) != (sim_b >= on_threshold)
+                   and (a + 1, b) not in refined]
+        if not windows:
+            break
+        for window in windows:
+            read_window(*window)
+            refined.add(window)
+    cap.release()
+
+    print(f"Stride scan: computed {len(dense)} of {total_frames} frames "
+          f"({len(dense) / total_frames:.1%}), refined {len(refined)} transitions")
+
+    known_frames = np.array(sorted(dense))
+    known_values = np.array([dense[frame] for frame in known_frames], dtype=np.float64)
+    previous_known = np.searchsorted(known_frames, np.arange(total_frames), side="right") - 1
+    return known_values[previous_known]
+
+
+def probe_keyframes(video_path):
+    """
+    List keyframes of the first video stream in presentation order.
+    Returns ([(frame_number, seconds_from_start), ...], total_frames).
+    """
+    probe = ffmpeg.probe(video_path, select_streams="v:0",
+                         show_entries="packet=pts_time,flags")
+    packets = [packet for packet in probe.get("packets", [])
+               if packet.get("pts_time", "N/A") != "N/A"]
+    if not packets:
+        return [], 0
+    pts = sorted(float(packet["pts_time"]) for packet in packets)
+    origin = pts[0]
+    frame_numbers = {t: i for i, t in enumerate(pts)}
+    keyframes = sorted((frame_numbers[float(packet["pts_time"])], float(packet["pts_time"]) - origin)
+                       for packet in packets if "K" in packet.get("flags", ""))
+    return keyframes, len(pts)
+
+
+def plan_segments(keyframes, total_frames, num_segments):
+    """
+    Split the video into at most num_segments (start_frame, num_frames, start_time)
+    segments whose boundaries fall on keyframes.
+    """
+    boundaries = [(0, 0.0)]
+    for i in range(1, num_segments):
+        target = total_frames * i / num_segments
+        frame_number, start_time = min(keyframes, key=lambda k: abs(k[0] - target))
+        if frame_number > boundaries[-1][0]:
+            boundaries.append((frame_number, start_time))
+    segments = []
+    for i, (start_frame, start_time) in enumerate(boundaries):
+        end_frame = boundaries[i + 1][0] if i + 1 < len(boundaries) else total_frames
+        segments.append((start_frame, end_frame - start_frame, start_time))
+    return segments
+
+
+def scan_segment(video_path, roi, reference_image, decoder, start_frame, start_time, num_frames,
+                 debug_sink=None, slide_roi=None, fps=None, detect_size=None, gate_tolerance=None,
+                 peak_threshold=None):
+    """
+    Worker entry point: compute the similarity trace, slide crops and ROI gate counts of one video segment.
+    """
+    roi_frames = DECODER_BACKENDS[decoder](
+        video_path, roi, start_frame=start_frame, start_time=start_time, num_frames=num_frames,
+        slide_roi=slide_roi, detect_size=detect_size)
+    slide_collector = SlideCollector(fps, peak_threshold, SLIDE_CROP_LIMIT) if slide_roi is not None else None
+    gate = RoiChangeGate(gate_tolerance) if gate_tolerance is not None else None
+    similarities = compute_frame_similarities(
+        roi_frames, reference_image, start_frame, debug_sink, slide_collector, gate=gate)
+    if debug_sink is not None:
+        debug_sink.close()
+    return (similarities, slide_collector.slide_crops() if slide_collector else {},
+            gate.counts() if gate else (0, 0))
+
+
+def scan_similarities_parallel(video_path, roi, reference_image, decoder, workers, debug_sink=None,
+                               slide_roi=None, fps=None, detect_size=None, gate=None, peak_threshold=None):
+    """
+    Scan keyframe-aligned segments in a process pool and stitch their traces in order.
+    Returns (similarities, slide_crops), or None when the video cannot be split or a
+    segment came back incomplete, so the caller can fall back to the serial scan.
+    """
+    try:
+        keyframes, total_frames = probe_keyframes(video_path)
+    except ffmpeg.Error as e:
+        print(f"FFmpeg error: {e.stderr.decode()}")
+        return None
+    segments = plan_segments(keyframes, total_frames, workers * SEGMENTS_PER_WORKER) if keyframes else []
+    if len(segments) < 2:
+        print("Warning: Not enough keyframes to split the video into segments.")
+        return None
+    print(f"Scanning {len(segments)} segments with {workers} workers")
+    stage_profiler.note("Stages inside the --workers processes are not included; "
+                        "their time only shows in extract_frames.scan.")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for i, (start_frame, num_frames, start_time) in enumerate(segments):
+            # The last segment runs until the decoder stops, exactly like the serial scan
+            limit = num_frames if i + 1 < len(segments) else None
+            futures.append(executor.submit(scan_segment, video_path, roi, reference_image, decoder,
+                                           start_frame, start_time, limit, debug_sink, slide_roi, fps,
+                                           detect_size, gate.tolerance if gate else None, peak_threshold))
+        results = [future.result() for future in futures]
+
+    for (start_frame, num_frames, _), (result, _, _) in zip(segments[:-1], results[:-1]):
+        if len(result) != num_frames:
+            print(f"Warning: Segment starting at frame {start_frame} returned "
+                  f"{len(result)} of {num_frames} frames.")
+            return None
+    similarities = np.concatenate([result for result, _, _ in results])
+    slide_crops = {}
+    for _, crops, gate_counts in results:
+        slide_crops.update(crops)
+        if gate is not None:
+            gate.merge(gate_counts)
+    return similarities, slide_crops
+
+
+def video_fingerprint(video_path, chunk_size=1 << 20):
+    """
+    Cheap content fingerprint: file size plus the first, middle and last chunk.
+    """
+    size = os.path.getsize(video_path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(video_path, "rb") as video_file:
+        for offset in (0, max(0, size // 2 - chunk_size // 2), max(0, size - chunk_size)):
+            video_file.seek(offset)
+            digest.update(video_file.read(chunk_size))
+    return digest.hexdigest()
+
+
+def trace_cache_key(video_path, preset_key, reference_path, decoder, scan_options=None):
+    """
+    Everything the per-frame similarity trace depends on, as one string.
+    """
+    with open(reference_path, "rb") as reference_file:
+        reference_digest = hashlib.sha256(reference_file.read()).hexdigest()
+    return json.dumps({
+        "video": video_fingerprint(video_path),
+        "preset": [preset_key, CONFIG_PRESETS[preset_key]],
+        "reference": reference_digest,
+        "decoder": decoder,
+        "scan": scan_options,
+    }, sort_keys=True)
+
+
+def load_trace_cache(cache_path, cache_key):
+    """
+    Return (similarities, complete) from a cache file written for cache_key,
+    or (None, False) if there is none.
+    """
+    try:
+        with np.load(cache_path) as data:
+            if str(data["key"]) != cache_key:
+                return None, False
+            return data["similarities"], bool(data["complete"])
+    except (OSError, KeyError, ValueError):
+        return None, False
+
+
+def save_trace_cache(cache_path, cache_key, similarities, complete):
+    # Write to a temporary file first so a crash never leaves a truncated cache behind
+    temp_path = cache_path + ".tmp"
+    with stage_profiler.stage("save_trace_cache"), open(temp_path, "wb") as cache_file:
+        np.savez(cache_file, key=cache_key, complete=complete,
+                 similarities=np.asarray(similarities, dtype=np.float64))
+    os.replace(temp_path, cache_path)
+
+
+def scan_similarities_resumable(video_path, roi, slide_roi, reference_image, decoder, fps,
+                                debug_sink=None, cache=None, partial=None, detect_size=None, gate=None,
+                                peak_threshold=None):
+    """
+    Serial scan that checkpoints its trace to the cache and, given a partial trace from
+    an interrupted run, resumes from the last keyframe before the point where it stopped.
+    Returns (similarities, slide_crops).
+    """
+    start_frame, start_time = 0, 0.0
+    if partial is not None and len(partial):
+        try:
+            keyframes, _ = probe_keyframes(video_path)
+        except ffmpeg.Error:
+            keyframes = []
+        earlier = [keyframe for keyframe in keyframes if keyframe[0] < len(partial)]
+        if earlier:
+            start_frame, start_time = earlier[-1]
+            print(f"Resuming the scan at frame {start_frame} of {len(partial)} cached frames")
+    prefix = partial[:start_frame] if start_frame else np.empty(0, dtype=np.float64)
+
+    def checkpoint(similarities):
+        save_trace_cache(*cache, np.concatenate((prefix, similarities)), complete=False)
+
+    roi_frames = DECODER_BACKENDS[decoder](
+        video_path, roi, start_frame=start_frame, start_time=start_time, slide_roi=slide_roi,
+        detect_size=detect_size)
+    slide_collector = SlideCollector(fps, peak_threshold, SLIDE_CROP_LIMIT) if slide_roi is not None else None
+    similarities = compute_frame_similarities(
+        roi_frames, reference_image, start_frame, debug_sink, slide_collector,
+        checkpoint if cache else None, gate)
+    if start_frame and not len(similarities):
+        print("Warning: Could not resume the scan; starting over.")
+        return scan_similarities_resumable(video_path, roi, slide_roi, reference_image, decoder, fps,
+                                           debug_sink, cache, detect_size=detect_size, gate=gate,
+                                           peak_threshold=peak_threshold)
+
+    similarities = np.concatenate((prefix, similarities))
+    if cache:
+        save_trace_cache(*cache, similarities, complete=True)
+    return similarities, slide_collector.slide_crops() if slide_collector else {}
+
+
+def find_peak_intervals(similarities, peak_threshold):
+    """
+    Return the (start_frames, end_frames) arrays of every run of frames at or above peak_threshold.
+    """
+    above = (similarities >= peak_threshold).astype(np.int8)
+    edges = np.diff(above, prepend=0, append=0)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+
+def detect_intervals(similarities, peak_threshold, fps):
+    """
+    Find peak runs and merge those separated by gaps shorter than GAP_DURATION_THRESHOLD.
+    Returns a list of (start_seconds, end_seconds) tuples.
+    """
+    start_frames, end_frames = find_peak_intervals(similarities, peak_threshold)
+    if not len(start_frames):
+        return []
+
+    # Use time-based merging threshold for robustness across frame rates
+    gap_durations = start_frames[1:] - end_frames[:-1] - 1
+    new_interval = np.concatenate(([True], gap_durations / fps >= GAP_DURATION_THRESHOLD))
+    first_runs = np.flatnonzero(new_interval)
+    last_runs = np.append(first_runs[1:] - 1, len(start_frames) - 1)
+    return list(zip((start_frames[first_runs] / fps).tolist(), (end_frames[last_runs] / fps).tolist()))
+
+
+def format_srt_time(seconds):
+    return f"{int(seconds // 3600):02}:{int((seconds % 3600) // 60):02}:{int(seconds % 60):02},{int((seconds % 1) * 1000):03}"
+
+
+class SubtitleWriter:
+    """
+    Write numbered SRT (and optionally ASS) entries one interval at a time.
+    Each entry starts where the previous one ended and ends END_DELAY after its interval.
+    """
+
+    def __init__(self, subtitle_path, ass_path=None, title=""):
+        self.subtitle_path = subtitle_path
+        self.ass_path = ass_path
+        self.sub_file = open(subtitle_path, "w", encoding="utf-8")
+        self.ass_file = None
+        if ass_path:
+            self.ass_file = open(ass_path, "w", encoding='utf-8-sig')
+            self.ass_file.write(ASS_HEADER_TEMPLATE.format(title=title))
+        self.seq = 1
+        self.prev_end = 0.0
+
+    def write(self, interval, text=None):
+        curr_end = END_DELAY + interval[1]
+
+        # Shift the start time slightly after the previous end (except for the first interval)
+        adjusted_start = self.prev_end
+
+        start_str = format_srt_time(adjusted_start)
+        end_str = format_srt_time(curr_end)
+        if text is None:
+            text = f"{self.seq:04d}"
+
+        self.sub_file.write(f"{self.seq}\n")
+        self.sub_file.write(f"{start_str} --> {end_str}\n")
+        self.sub_file.write(f"{text}\n\n")
+
+        if self.ass_file:
+            # Convert SRT time to ASS time (replace comma with dot)
+            start_ass = start_str.replace(',', '.')
+            end_ass = end_str.replace(',', '.')
+            dialogue = f"Dialogue: 0,{start_ass},{end_ass},Default,,0,0,0,,{text}"
+            self.ass_file.write(dialogue + '\n')
+
+        self.prev_end = curr_end
+        self.seq += 1
+
+    def flush(self):
+        self.sub_file.flush()
+        if self.ass_file:
+            self.ass_file.flush()
+
+    def close(self):
+        self.sub_file.close()
+        if self.ass_file:
+            self.ass_file.close()
+            print(f"Generated ASS subtitles at {self.ass_path}")
+        print(f"Total subtitles generated: {self.seq - 1}")
+
+
+class StreamingIntervalDetector:
+    """
+    Online version of the peak detection and gap merging in extract_frames.
+    The peak threshold is either absolute or calibrated once from the first
+    warmup_frames similarities (max * THRESHOLD_RATIO). Afterwards only constant
+    state is kept, and each merged (start_frame, end_frame) interval is returned
+    as soon as the gap behind it is too long for a later peak to merge into it.
+    """
+
+    def __init__(self, fps, threshold=None, warmup_frames=0):
+        self.fps = fps
+        self.peak_threshold = threshold
+        self.warmup_frames = warmup_frames
+        self.warmup = []
+        self.run_start = None
+        self.pending = None
+        self.last_frame = None
+
+    def feed(self, frame_number, similarity):
+        """
+        Add one frame; returns the intervals that became final.
+        """
+        if self.peak_threshold is None:
+            self.warmup.append((frame_number, similarity))
+            if len(self.warmup) < self.warmup_frames:
+                return []
+            return self._calibrate()
+        return self._update(frame_number, similarity)
+
+    def finish(self):
+        """
+        Close the stream; returns the remaining intervals.
+        """
+        finished = self._calibrate() if self.warmup else []
+        if self.run_start is not None:
+            finished.extend(self._close_run(self.run_start, self.last_frame))
+            self.run_start = None
+        if self.pending is not None:
+            finished.append(self.pending)
+            self.pending = None
+        return finished
+
+    def _calibrate(self):
+        self.peak_threshold = max(sim for _, sim in self.warmup) * THRESHOLD_RATIO
+        print(f"Calibrated peak threshold {self.peak_threshold:.4f} from {len(self.warmup)} frames")
+        warmup, self.warmup = self.warmup, []
+        finished = []
+        for frame_number, similarity in warmup:
+            finished.extend(self._update(frame_number, similarity))
+        return finished
+
+    def _update(self, frame_number, similarity):
+        self.last_frame = frame_number
+        finished = []
+        if similarity >= self.peak_threshold:
+            if self.run_start is None:
+                self.run_start = frame_number
+            return finished
+        if self.run_start is not None:
+            finished.extend(self._close_run(self.run_start, frame_number - 1))
+            self.run_start = None
+        # No later peak can start before the next frame, so the gap is at least this long
+        if self.pending is not None and (frame_number - self.pending[1]) / self.fps >= GAP_DURATION_THRESHOLD:
+            finished.append(self.pending)
+            self.pending = None
+        return finished
+
+    def _close_run(self, start_frame, end_frame):
+        finished = []
+        if self.pending is not None:
+            gap_duration = start_frame - self.pending[1] - 1
+            if gap_duration / self.fps < GAP_DURATION_THRESHOLD:
+                self.pending = (self.pending[0], end_frame)
+                return finished
+            finished.append(self.pending)
+        self.pending = (start_frame, end_frame)
+        return finished
+
+
+# popcount of every byte value, for Hamming distances between packed hashes
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def perceptual_hash(gray_image):
+    """
+    64-bit DCT perceptual hash: the signs of the 8x8 lowest frequencies of a 32x32
+    thumbnail relative to their median, packed into an unsigned integer.
+    """
+    thumbnail = cv2.resize(gray_image, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_frequencies = cv2.dct(thumbnail)[:8, :8].flatten()
+    bits = low_frequencies > np.median(low_frequencies[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class SlideHashIndex:
+    """
+    Perceptual hashes of slides with a vectorized Hamming-distance lookup.
+    Each entry points to a slide image as (slides directory, seq).
+    """
+
+    def __init__(self, entries=()):
+        self.entries = list(entries)
+        # Hashes of the entries in the first len(entries) slots; add() doubles the array when
+        # it is full instead of copying it on every slide
+        self._hashes = np.array([slide_hash for slide_hash, _, _ in self.entries], dtype=np.uint64)
+
+    @property
+    def hashes(self):
+        return self._hashes[:len(self.entries)]
+
+    def add(self, slide_hash, slides, seq):
+        if len(self.entries) == len(self._hashes):
+            self._hashes = np.resize(self._hashes, max(16, 2 * len(self._hashes)))
+        self._hashes[len(self.entries)] = slide_hash
+        self.entries.append((slide_hash, slides, seq))
+
+    def lookup(self, slide_hash, max_distance):
+        """
+        Return the indices of the entries within max_distance bits of slide_hash, nearest first.
+        """
+        if not self.entries:
+            return []
+        xor = np.bitwise_xor(self.hashes, np.uint64(slide_hash))
+        distances = _POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+        candidates = np.flatnonzero(distances <= max_distance)
+        return candidates[np.argsort(distances[candidates], kind="stable")].tolist()
+
+    @classmethod
+    def load(cls, index_path):
+        try:
+            with open(index_path, encoding="utf-8") as index_file:
+                data = json.load(index_file)
+        except (OSError, ValueError):
+            return cls()
+        return cls((int(entry["hash"], 16), entry["slides"], entry["seq"]) for entry in data.get("entries", []))
+
+    def save(self, index_path):
+        temp_path = index_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as index_file:
+            json.dump({"entries": [{"hash": f"{slide_hash:016x}", "slides": slides, "seq": seq}
+                                   for slide_hash, slides, seq in self.entries]}, index_file, ensure_ascii=False)
+        os.replace(temp_path, index_path)
+
+
+def update_hash_index(index_path, slides_dir, new_entries, timeout=60):
+    """
+    Replace the entries of slides_dir in the shared index with new_entries.
+    A lock file keeps concurrent runs (batch jobs) from losing each other's updates.
+    """
+    lock_path = index_path + ".lock"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                print(f"Warning: Hash index {index_path} stayed locked; not updating it.")
+                return
+            time.sleep(0.1)
+    try:
+        index = SlideHashIndex.load(index_path)
+        kept = [entry for entry in index.entries if entry[1] != slides_dir]
+        SlideHashIndex(kept + new_entries).save(index_path)
+    finally:
+        os.remove(lock_path)
+
+
+def dedupe_slides(slides_dir, slide_grays, index_path=None):
+    """
+    Group slides that show the same line. Each slide's perceptual hash is looked up among
+    the earlier slides of this video (and, with index_path, the slides of other episodes);
+    candidates within SLIDE_HASH_DISTANCE bits are confirmed with compute_similarity.
+    Writes {seq: representative} for every duplicate to <slides_dir>/_dedupe.json and
+    returns that mapping.
+    """
+    slides_dir = os.path.abspath(slides_dir)
+    index = SlideHashIndex()
+    if index_path:
+        index = SlideHashIndex(entry for entry in SlideHashIndex.load(index_path).entries
+                               if entry[1] != slides_dir)
+    external_grays = {}
+    duplicates = {}
+    new_entries = []
+    for seq, gray in sorted(slide_grays.items()):
+        slide_hash = perceptual_hash(gray)
+        for candidate in index.lookup(slide_hash, SLIDE_HASH_DISTANCE):
+            _, candidate_dir, candidate_seq = index.entries[candidate]
+            if candidate_dir == slides_dir:
+                candidate_gray = slide_grays[candidate_seq]
+            else:
+                candidate_key = (candidate_dir, candidate_seq)
+                if candidate_key not in external_grays:
+                    external_grays[candidate_key] = cv2.imread(
+                        os.path.join(candidate_dir, f"{candidate_seq:04d}.png"), cv2.IMREAD_GRAYSCALE)
+                candidate_gray = external_grays[candidate_key]
+                if candidate_gray is None:
+                    continue
+            if compute_similarity(gray, candidate_gray) >= SLIDE_DEDUPE_THRESHOLD:
+                duplicates[seq] = {"seq": candidate_seq} if candidate_dir == slides_dir else \
+                    {"slides": candidate_dir, "seq": candidate_seq}
+                break
+        else:
+            index.add(slide_hash, slides_dir, seq)
+            new_entries.append((slide_hash, slides_dir, seq))
+
+    with open(os.path.join(slides_dir, "_dedupe.json"), "w", encoding="utf-8") as dedupe_file:
+        json.dump({"duplicates": {str(seq): source for seq, source in duplicates.items()}},
+                  dedupe_file, indent=2, ensure_ascii=False)
+    if index_path:
+        update_hash_index(index_path, slides_dir, new_entries)
+    external = sum(1 for source in duplicates.values() if "slides" in source)
+    print(f"Dedupe: {len(duplicates)} of {len(slide_grays)} slides repeat an earlier line "
+          f"({external} from other episodes)")
+    return duplicates
+
+
+def extract_frames(video_path, debug, slides, enable_merge, generate_ass, decoder="opencv", workers=1,
+                   stride=1, max_stride=None, use_cache=True, detect_scale=1.0, roi_gate=True,
+                   debug_archive=False, reference_image=None, dedupe=False, hash_index=None, threshold=None):
     """
     Extract key frame intervals from video based on visual similarity to a reference image.
     Generates subtitles and optionally slides of each detected interval.
+    reference_image, if given, is used instead of loading KUROYURI_PATH again.
+    threshold, if given, is an absolute peak threshold instead of max * THRESHOLD_RATIO.
+    Returns a dict of run statistics, or None if the video could not be processed.
     """
     # Configuration loading removed; using manual constants
     # Validate THRESHOLD_RATIO
@@ -218,6 +1538,7 @@ def extract_frames(video_path, debug, slides, enable_merge, generate_ass):
         if os.path.exists(debug_frame_dir):
             shutil.rmtree(debug_frame_dir)
         os.makedirs(debug_frame_dir, exist_ok=True)
+    debug_sink = DebugFrameSink(debug_frame_dir, debug_archive) if debug else None
 
     # Open video and validate resolution
     cap = cv2.VideoCapture(video_path)
@@ -251,114 +1572,94 @@ def extract_frames(video_path, debug, slides, enable_merge, generate_ass):
         return
 
     # Load reference grayscale image for similarity comparison
-    reference_image = cv2.imread(reference_path, cv2.IMREAD_GRAYSCALE)
-
-    DEFAULT_WIDTH = preset["DEFAULT_WIDTH"]
-    DEFAULT_HEIGHT = preset["DEFAULT_HEIGHT"]
+    if reference_image is None:
+        reference_image = cv2.imread(reference_path, cv2.IMREAD_GRAYSCALE)
 
-    YURI_X1_RATIO = preset["YURI_X1_RATIO"]
-    YURI_Y1_RATIO = preset["YURI_Y1_RATIO"]
-    YURI_X2_RATIO = preset["YURI_X2_RATIO"]
-    YURI_Y2_RATIO = preset["YURI_Y2_RATIO"]
-
-    SLIDE_X1_RATIO = preset["SLIDE_X1_RATIO"]
-    SLIDE_Y1_RATIO = preset["SLIDE_Y1_RATIO"]
-    SLIDE_X2_RATIO = preset["SLIDE_X2_RATIO"]
-    SLIDE_Y2_RATIO = preset["SLIDE_Y2_RATIO"]
-
-    x1, y1 = int(YURI_X1_RATIO *
-                 frame_width), int(YURI_Y1_RATIO * frame_height)
-    x2, y2 = int(YURI_X2_RATIO *
-                 frame_width), int(YURI_Y2_RATIO * frame_height)
-
-    frame_count = 0
-    similarities = []
+    # Slides always come from full-resolution frames; detection may run on a downscaled stream
+    _, slide_roi = preset_regions(preset, frame_width, frame_height)
+    roi, detect_size = detection_region(preset, frame_width, frame_height, detect_scale)
+    x1_s, y1_s, x2_s, y2_s = slide_roi
     high_similarity_intervals = []
-    active_interval = None
-
-    # Iterate over video frames, extract region of interest, compare similarity
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        time_stamp = frame_count / fps
-        yuri_area = frame[y1:y2, x1:x2]
-        yuri_sharpened = enhance_sharpness(yuri_area)
-        yuri_binary = binarize_image(yuri_sharpened)
-
-        if debug:
-            # Save processed frame for debugging
-            yuri_filename = os.path.join(
-                debug_frame_dir, f"{frame_count:06d}.png")
-            cv2.imwrite(yuri_filename, yuri_binary)
-
-        similarity = compute_similarity(yuri_binary, reference_image)
-        similarities.append([frame_count, similarity])
-
-        frame_count += 1
+    if detect_size:
+        print(f"Detecting on a {detect_scale:g}x downscaled stream ({detect_size[0]}x{detect_size[1]} region)")
 
+    # The capture is only needed for metadata; frames come from the decoder backend
     cap.release()
-
-    # Analyze similarity list to extract high similarity intervals
-    similarity_values = [sim for _, sim in similarities]
-    max_sim = max(similarity_values)
-    peak_threshold = max_sim * THRESHOLD_RATIO
-
-    # Identify peak intervals
-    peak_intervals = []
-    start_frame = None
-    for frame_num, sim in similarities:
-        if sim >= peak_threshold:
-            if start_frame is None:
-                start_frame = frame_num
-        else:
-            if start_frame is not None:
-                end_frame = frame_num - 1
-                peak_intervals.append((start_frame, end_frame))
-                start_frame = None
-    if start_frame is not None:
-        peak_intervals.append((start_frame, frame_count - 1))
-
-    # Convert frame numbers to time
-    fps = cap.get(cv2.CAP_PROP_FPS) if cap.isOpened() else fps
-    peak_intervals_sec = [(start / fps, end / fps)
-                          for start, end in peak_intervals]
-
-    # Merge peak intervals only if gap duration < GAP_DURATION_THRESHOLD
-    high_similarity_intervals = []
-    if peak_intervals_sec:
-        previous_start_frame, previous_end_frame = peak_intervals[0]
-        for i in range(1, len(peak_intervals)):
-            current_start_frame, current_end_frame = peak_intervals[i]
-            gap_start_frame = previous_end_frame + 1
-            gap_end_frame = current_start_frame - 1
-            gap_duration = gap_end_frame - gap_start_frame + 1
-
-            # Use time-based merging threshold for robustness across frame rates
-            gap_duration_sec = gap_duration / fps
-            if gap_duration_sec < GAP_DURATION_THRESHOLD:
-                # Merge: extend previous interval
-                previous_end_frame = current_end_frame
+    print(f"Using decoder backend: {decoder}")
+
+    # Slide crops are only needed when slides are kept or compared for merging
+    need_slides = slides or enable_merge
+    if not need_slides:
+        slide_roi = None
+
+    # Reuse the similarity trace of a previous run (or resume a partial one) when possible
+    cache_path = os.path.join(video_dir, f"{video_name}.trace.npz") if use_cache else None
+    cached_similarities, cache_complete = None, False
+    if cache_path:
+        cache_key = trace_cache_key(video_path, preset_key, reference_path, decoder, {
+            "stride": (stride, max_stride, THRESHOLD_RATIO if threshold is None else threshold) if stride > 1 else None,
+            "scale": detect_scale if detect_size else None,
+            "gate": ROI_GATE_TOLERANCE if roi_gate and ROI_GATE_TOLERANCE else None,
+        })
+        if not debug:
+            with stage_profiler.stage("load_trace_cache"):
+                cached_similarities, cache_complete = load_trace_cache(cache_path, cache_key)
+
+    # Iterate over video frames, extract region of interest, compare similarity.
+    # Slide crops that may be needed later are captured in the same pass.
+    similarities = None
+    slide_crops = {}
+    gate = RoiChangeGate(ROI_GATE_TOLERANCE) if roi_gate else None
+    with stage_profiler.stage("extract_frames.scan"):
+        if cache_complete:
+            print(f"Loaded similarity trace of {len(cached_similarities)} frames from {cache_path}")
+            similarities = cached_similarities
+        elif stride > 1:
+            if decoder != "opencv" or workers > 1:
+                print("Note: Stride scanning always uses the OpenCV decoder in a single process.")
+            if threshold is None:
+                print("Note: Without --threshold, stride scanning takes the threshold from the frames it "
+                      "computed; boundaries can differ from a full scan by a frame.")
+            similarities = scan_similarities_strided(
+                video_path, roi, reference_image, stride, max(stride, max_stride or stride),
+                debug_sink, detect_size, threshold)
+        elif workers > 1 and cached_similarities is None:
+            result = scan_similarities_parallel(
+                video_path, roi, reference_image, decoder, workers, debug_sink,
+                slide_roi, fps, detect_size, gate, threshold)
+            if result is None:
+                print("Falling back to serial scanning.")
             else:
-                # Save and start a new one
-                high_similarity_intervals.append((
-                    previous_start_frame / fps,
-                    previous_end_frame / fps
-                ))
-                previous_start_frame, previous_end_frame = current_start_frame, current_end_frame
-
-        high_similarity_intervals.append((
-            previous_start_frame / fps,
-            previous_end_frame / fps
-        ))
+                similarities, slide_crops = result
+        if similarities is None:
+            similarities, slide_crops = scan_similarities_resumable(
+                video_path, roi, slide_roi, reference_image, decoder, fps,
+                debug_sink, cache_path and (cache_path, cache_key),
+                cached_similarities, detect_size, gate, threshold)
+        elif cache_path and not cache_complete:
+            save_trace_cache(cache_path, cache_key, similarities, complete=True)
+        frame_count = len(similarities)
+        if gate is not None:
+            gate.report()
+    if debug_sink is not None:
+        debug_sink.close()
+
+    if not frame_count:
+        print("Error: No frames could be read from the video.")
+        return
+
+    # Analyze similarity trace to extract high similarity intervals
+    peak_threshold = threshold if threshold is not None else similarities.max() * THRESHOLD_RATIO
+    with stage_profiler.stage("detect_intervals"):
+        high_similarity_intervals = detect_intervals(similarities, peak_threshold, fps)
 
     if debug:
         csv_path = os.path.join(debug_frame_dir, "_a.csv")
         with open(csv_path, mode="w", newline="") as csv_file:
             writer = csv.writer(csv_file)
             writer.writerow(["Frame", "Similarity"])
-            writer.writerows(similarities)
+            writer.writerows(enumerate(similarities.tolist()))
+        debug_sink.finish(similarities)
 
     # Insert slide extraction block before subtitle generation
     merged_intervals = []
@@ -366,26 +1667,36 @@ def extract_frames(video_path, debug, slides, enable_merge, generate_ass):
     previous_slide = None
     previous_start, previous_end = None, None
     renamed_set = set()
+    slide_cap = None
+    seek_count = 0
+    image_writer = ImageWriter() if need_slides else None
+    slide_grays = {}
 
     for interval in high_similarity_intervals:
         start_time, end_time = interval
         frame_target = SLIDES_OFFSET + int(start_time * fps)
-        cap = cv2.VideoCapture(video_path)
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_target)
-        ret, frame = cap.read()
-        cap.release()
-        if not ret:
+        if not need_slides:
+            # The slide would be thrown away; only keep the intervals whose slide frame exists
+            if frame_target < frame_count:
+                merged_intervals.append(interval)
             continue
-
-        x1_s, y1_s = int(SLIDE_X1_RATIO *
-                         frame_width), int(SLIDE_Y1_RATIO * frame_height)
-        x2_s, y2_s = int(SLIDE_X2_RATIO *
-                         frame_width), int(SLIDE_Y2_RATIO * frame_height)
-        slide_frame = frame[y1_s:y2_s, x1_s:x2_s]
+        slide_frame = slide_crops.get(frame_target)
+        if slide_frame is None:
+            # Not captured during the scan (stride scanning, segment edges): seek for it
+            if slide_cap is None:
+                slide_cap = cv2.VideoCapture(video_path)
+            with stage_profiler.stage("extract_frames.slides.seek"):
+                slide_cap.set(cv2.CAP_PROP_POS_FRAMES, frame_target)
+                ret, frame = slide_cap.read()
+            seek_count += 1
+            if not ret:
+                continue
+            slide_frame = frame[y1_s:y2_s, x1_s:x2_s]
         current_gray = cv2.cvtColor(slide_frame, cv2.COLOR_BGR2GRAY)
 
         if previous_slide is not None:
-            sim = compute_similarity(current_gray, previous_slide)
+            with stage_profiler.stage("extract_frames.slides.compare"):
+                sim = compute_similarity(current_gray, previous_slide)
 
             if sim >= ENABLE_MERGE_REPORT_THRESHOLD:
                 print(f"[INFO] slides #{len(merged_intervals) + 1:04d} "
@@ -399,6 +1710,7 @@ def extract_frames(video_path, debug, slides, enable_merge, generate_ass):
                 # Rename the original slide image if it exists and hasn't been renamed yet
                 original_slide = os.path.join(
                     slides_dir, f"{slide_index:04d}.png")
+                image_writer.wait(original_slide)
                 if os.path.exists(original_slide) and slide_index not in renamed_set:
                     new_slide = os.path.join(
                         slides_dir, f"{slide_index:04d}-a.png")
@@ -407,7 +1719,8 @@ def extract_frames(video_path, debug, slides, enable_merge, generate_ass):
                 count = merge_counts.get(slide_index, 0)
                 merged_path = os.path.join(
                     slides_dir, f"{slide_index:04d}-merged-{count}.png")
-                cv2.imwrite(merged_path, slide_frame)
+                with stage_profiler.stage("extract_frames.slides.write"):
+                    image_writer.write(merged_path, slide_frame)
                 merge_counts[slide_index] = count + 1
                 previous_end = end_time
                 merged_intervals[-1] = (previous_start, previous_end)
@@ -415,56 +1728,39 @@ def extract_frames(video_path, debug, slides, enable_merge, generate_ass):
 
         slide_path = os.path.join(
             slides_dir, f"{len(merged_intervals)+1:04d}.png")
-        cv2.imwrite(slide_path, slide_frame)
+        with stage_profiler.stage("extract_frames.slides.write"):
+            image_writer.write(slide_path, slide_frame)
         merged_intervals.append((start_time, end_time))
+        slide_grays[len(merged_intervals)] = current_gray
         previous_slide = current_gray
         previous_start, previous_end = start_time, end_time
 
+    if slide_cap is not None:
+        slide_cap.release()
+    if image_writer is not None:
+        image_writer.close()
+    if seek_count:
+        print(f"Slides: {seek_count} of {len(high_similarity_intervals)} read by seeking")
+    if (dedupe or hash_index) and not slides:
+        print("Note: --dedupe and --hash-index only apply together with --slides.")
+    if slides and (dedupe or hash_index):
+        # Slides renamed to -a.png by merging are not recognized on their own
+        with stage_profiler.stage("dedupe_slides"):
+            dedupe_slides(slides_dir, {seq: gray for seq, gray in slide_grays.items() if seq not in renamed_set},
+                          hash_index)
+
     high_similarity_intervals = merged_intervals
 
-    video_dir, video_filename = os.path.split(video_path)
-    video_name, _ = os.path.splitext(video_filename)
     subtitle_path = os.path.join(video_dir, f"{video_name}.srt")
-    
+
     # Generate ASS file path if enabled
     ass_path = os.path.join(video_dir, f"{video_name}.ass") if generate_ass else None
-    ass_content = ""
-    if generate_ass:
-        ass_content = ASS_HEADER_TEMPLATE.format(title=video_name)
-
-    with open(subtitle_path, "w") as sub_file:
-        seq = 1
-        prev_end = 0.0
+    with stage_profiler.stage("extract_frames.subtitles"):
+        writer = SubtitleWriter(subtitle_path, ass_path, title=video_name)
         for interval in high_similarity_intervals:
-            curr_end = END_DELAY + interval[1]
+            writer.write(interval)
+        writer.close()
 
-            # Shift the start time slightly after the previous end (except for the first interval)
-            adjusted_start = prev_end if prev_end > 0 else prev_end
-
-            start_str = f"{int(adjusted_start // 3600):02}:{int((adjusted_start % 3600) // 60):02}:{int(adjusted_start % 60):02},{int((adjusted_start % 1) * 1000):03}"
-            end_str = f"{int(curr_end // 3600):02}:{int((curr_end % 3600) // 60):02}:{int(curr_end % 60):02},{int((curr_end % 1) * 1000):03}"
-
-            sub_file.write(f"{seq}\n")
-            sub_file.write(f"{start_str} --> {end_str}\n")
-            sub_file.write(f"{seq:04d}\n\n")
-
-            if generate_ass:
-                # Convert SRT time to ASS time (replace comma with dot)
-                start_ass = start_str.replace(',', '.')
-                end_ass = end_str.replace(',', '.')
-                text = f"{seq:04d}"
-                dialogue = f"Dialogue: 0,{start_ass},{end_ass},Default,,0,0,0,,{text}"
-                ass_content += dialogue + '\n'
-
-            prev_end = curr_end
-            seq += 1
-            
-    if generate_ass:
-        with open(ass_path, "w", encoding='utf-8-sig') as ass_file:
-            ass_file.write(ass_content)
-        print(f"Generated ASS subtitles at {ass_path}")
-
-    print(f"Total subtitles generated: {seq - 1}")
     # Clean up temporary slides folder if not saving output
     if temp_slides:
         shutil.rmtree(slides_dir)
@@ -472,10 +1768,453 @@ def extract_frames(video_path, debug, slides, enable_merge, generate_ass):
     print(
         f"Extracted {frame_count} frames, and generated subtitles at {subtitle_path}")
     if debug:
+        saved = "frame archive" if debug_archive else "frame images"
         print(
-            f"[DEBUG] Saved frame images and similarity data at {debug_frame_dir}")
+            f"[DEBUG] Saved {saved} and similarity data at {debug_frame_dir}")
+    return {"frames": frame_count, "intervals": len(high_similarity_intervals), "cached": cache_complete}
+
+
+def extract_frames_streaming(input_path, debug, slides, generate_ass, decoder="opencv",
+                             threshold=None, warmup_frames=0, raw_size=None, raw_fps=None, detect_scale=1.0,
+                             roi_gate=True, debug_archive=False, ocr=False, translate_to_chn=False):
+    """
+    Detect subtitle intervals in a single forward pass with bounded memory.
+    Frames come from a video file through the decoder backend, or as raw bgr24 frames
+    from stdin ("-") or a named pipe when raw_size is given. Subtitle entries (and slides)
+    are written as soon as each interval is final, so a recording can be subtitled
+    while it is still being captured.
+    With ocr, slide crops go straight from memory to an OCR thread (see 03_ocr.OcrPipeline),
+    and each subtitle entry is written with its recognized text once it is available.
+    """
+    if threshold is None and warmup_frames <= 0:
+        print("Error: Streaming mode needs --threshold or --warmup-frames.")
+        return
+
+    if input_path == "-":
+        video_dir, video_name = "", "stdin"
+    else:
+        video_dir, video_filename = os.path.split(input_path)
+        video_name, _ = os.path.splitext(video_filename)
+
+    if raw_size:
+        frame_width, frame_height = (int(value) for value in raw_size.lower().split("x"))
+        fps = raw_fps
+        if not fps:
+            print("Error: Raw input needs --raw-fps.")
+            return
+    else:
+        cap = cv2.VideoCapture(input_path)
+        if not cap.isOpened():
+            print("Error: Cannot open video file.")
+            return
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+        frame_width, frame_height = get_video_resolution(input_path)
+        if frame_width is None or frame_height is None:
+            print("Error: Unable to determine video resolution using FFmpeg.")
+            return
+
+    preset_key = is_valid_aspect_ratio(frame_width, frame_height)
+    if preset_key is None:
+        print("Error: Unsupported aspect ratio.")
+        return
+    _, slide_roi = preset_regions(CONFIG_PRESETS[preset_key], frame_width, frame_height)
+    roi, detect_size = detection_region(CONFIG_PRESETS[preset_key], frame_width, frame_height, detect_scale)
+
+    reference_path = KUROYURI_PATH
+    print(f"Using reference image at: {reference_path}")
+    if not os.path.exists(reference_path):
+        print(f"Error: Reference image not found at: {reference_path}")
+        return
+    reference_image = cv2.imread(reference_path, cv2.IMREAD_GRAYSCALE)
+
+    slides_dir = os.path.join(video_dir, f"{video_name}-slides")
+    if slides:
+        if os.path.exists(slides_dir):
+            shutil.rmtree(slides_dir)
+        os.makedirs(slides_dir, exist_ok=True)
+    debug_sink = None
+    csv_writer = None
+    if debug:
+        debug_frame_dir = os.path.join(video_dir, "tmp_debug_frame")
+        print(f"[DEBUG] Debug frame output directory: {debug_frame_dir}")
+        if os.path.exists(debug_frame_dir):
+            shutil.rmtree(debug_frame_dir)
+        os.makedirs(debug_frame_dir, exist_ok=True)
+        debug_sink = DebugFrameSink(debug_frame_dir, debug_archive)
+        csv_file = open(os.path.join(debug_frame_dir, "_a.csv"), mode="w", newline="")
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(["Frame", "Similarity"])
+
+    ocr_stage = load_ocr_stage() if ocr else None
+    ocr_engine = ocr_stage.create_ocr() if ocr else None
+
+    # Slide crops are needed for the PNGs and for OCR
+    need_slides = slides or ocr
+    if raw_size:
+        stream = sys.stdin.buffer if input_path == "-" else open(input_path, "rb")
+        roi_frames = read_roi_frames_raw(stream, frame_width, frame_height, roi,
+                                         slide_roi if need_slides else None, detect_size)
+    else:
+        stream = None
+        roi_frames = DECODER_BACKENDS[decoder](input_path, roi, slide_roi=slide_roi if need_slides else None,
+                                               detect_size=detect_size)
+
+    subtitle_path = os.path.join(video_dir, f"{video_name}.srt")
+    ass_path = os.path.join(video_dir, f"{video_name}.ass") if generate_ass else None
+    writer = SubtitleWriter(subtitle_path, ass_path, title=video_name)
+    detector = StreamingIntervalDetector(fps, threshold, warmup_frames)
+
+    # Only candidates crossing the detector's threshold keep a crop, and they are released as
+    # their intervals are written, so no crop limit is needed here
+    slide_collector = SlideCollector(fps, detector.peak_threshold) if need_slides else None
+    image_writer = ImageWriter() if slides else None
+    slide_cap = None
+    gate = RoiChangeGate(ROI_GATE_TOLERANCE) if roi_gate else None
+
+    ocr_pipeline = None
+    if ocr:
+        def write_recognized(seq, row, interval):
+            # Runs on the OCR thread, which is the only writer of the subtitles in this mode
+            writer.write(interval, row["recognized_japanese"] or None)
+            writer.flush()
+
+        ocr_pipeline = ocr_stage.OcrPipeline(ocr_engine, translate_to_chn, write_recognized, OCR_QUEUE_SIZE)
+
+    seq = 0
+
+    def read_missing_slide(frame_target):
+        # Not captured during the scan: seek for it when the input is a file
+        nonlocal slide_cap
+        if raw_size:
+            return None
+        if slide_cap is None:
+            slide_cap = cv2.VideoCapture(input_path)
+        with stage_profiler.stage("extract_frames.slides.seek"):
+            slide_cap.set(cv2.CAP_PROP_POS_FRAMES, frame_target)
+            ret, frame = slide_cap.read()
+        if not ret:
+            return None
+        x1_s, y1_s, x2_s, y2_s = slide_roi
+        return frame[y1_s:y2_s, x1_s:x2_s]
+
+    def emit(intervals):
+        nonlocal seq
+        if slide_collector and slide_collector.peak_threshold is None and detector.peak_threshold is not None:
+            # Calibrated from the warm-up frames: from now on candidates must cross this threshold
+            slide_collector.set_peak_threshold(detector.peak_threshold)
+        for start_frame, end_frame in intervals:
+            seq += 1
+            slide_frame = None
+            if slide_collector:
+                frame_target = SLIDES_OFFSET + int((start_frame / fps) * fps)
+                slide_frame = slide_collector.crops.get(frame_target)
+                if slide_frame is None:
+                    slide_frame = read_missing_slide(frame_target)
+                if slide_frame is None:
+                    print(f"Warning: No slide captured for subtitle {seq} (frame {frame_target}).")
+                elif image_writer:
+                    image_writer.write(os.path.join(slides_dir, f"{seq:04d}.png"), slide_frame)
+                slide_collector.release(end_frame)
+            interval = (start_frame / fps, end_frame / fps)
+            if ocr_pipeline:
+                with stage_profiler.stage("OcrPipeline.submit"):
+                    ocr_pipeline.submit(seq, slide_frame, interval)
+            else:
+                writer.write(interval)
+        if intervals and not ocr_pipeline:
+            writer.flush()
+
+    frame_count = 0
+    similarity = None
+    for frame_number, (yuri_area, slide_area) in enumerate(stage_profiler.iterate("decode", roi_frames)):
+        with stage_profiler.stage("RoiChangeGate.unchanged"):
+            unchanged = gate is not None and gate.unchanged(yuri_area)
+        if unchanged:
+            yuri_binary = gate.binary
+            save_debug_roi(yuri_binary, frame_number, debug_sink)
+        else:
+            yuri_binary = prepare_roi(yuri_area, frame_number, debug_sink)
+            with stage_profiler.stage("compute_similarity"):
+                similarity = compute_similarity(yuri_binary, reference_image)
+            if gate is not None:
+                gate.binary = yuri_binary
+        if csv_writer:
+            csv_writer.writerow([frame_number, similarity])
+        if slide_collector:
+            with stage_profiler.stage("SlideCollector.observe"):
+                slide_collector.observe(frame_number, yuri_binary, slide_area)
+                slide_collector.resolve(frame_number, [similarity])
+        with stage_profiler.stage("StreamingIntervalDetector.feed"):
+            intervals = detector.feed(frame_number, similarity)
+        with stage_profiler.stage("extract_frames_streaming.emit"):
+            emit(intervals)
+        frame_count = frame_number + 1
+    # Like extract_frames, drop a last interval whose slide frame lies past the end of the video
+    emit([(start_frame, end_frame) for start_frame, end_frame in detector.finish()
+          if SLIDES_OFFSET + int((start_frame / fps) * fps) < frame_count])
+    if ocr_pipeline:
+        with stage_profiler.stage("OcrPipeline.close"):
+            rows = ocr_pipeline.close()
+        ocr_stage.write_results_csv(rows, ocr_stage.ocr_results_csv_path(slides_dir))
+    writer.close()
+    if gate is not None:
+        gate.report()
+
+    if stream is not None and stream is not sys.stdin.buffer:
+        stream.close()
+    if slide_cap is not None:
+        slide_cap.release()
+    if image_writer is not None:
+        image_writer.close()
+    if debug_sink is not None:
+        debug_sink.close()
+        debug_sink.finish()
+    if csv_writer:
+        csv_file.close()
+    print(f"Extracted {frame_count} frames, and generated subtitles at {subtitle_path}")
+
+
+def load_ocr_stage():
+    """
+    Import 03_ocr.py (not importable by name) for the fused OCR pipeline.
+    """
+    spec = importlib.util.spec_from_file_location(
+        "ocr_stage", os.path.join(os.path.dirname(os.path.abspath(__file__)), "03_ocr.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".avi", ".webm", ".flv", ".m4v")
+
+
+def list_batch_videos(input_dir=None, manifest=None):
+    """
+    Return the video paths of a batch, from a directory listing or a manifest file.
+    """
+    if input_dir:
+        return sorted(entry.path for entry in os.scandir(input_dir)
+                      if entry.is_file() and entry.name.lower().endswith(VIDEO_EXTENSIONS))
+    manifest_dir = os.path.dirname(os.path.abspath(manifest))
+    video_paths = []
+    with open(manifest, encoding="utf-8") as manifest_file:
+        for line in manifest_file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                video_paths.append(os.path.join(manifest_dir, line))
+    return video_paths
+
+
+def batch_outputs(video_path, slides, generate_ass):
+    video_dir, video_filename = os.path.split(video_path)
+    video_name, _ = os.path.splitext(video_filename)
+    outputs = [os.path.join(video_dir, f"{video_name}.srt")]
+    if generate_ass:
+        outputs.append(os.path.join(video_dir, f"{video_name}.ass"))
+    if slides:
+        outputs.append(os.path.join(video_dir, f"{video_name}-slides"))
+    return outputs
+
+
+def is_up_to_date(video_path, outputs):
+    video_mtime = os.path.getmtime(video_path)
+    return all(os.path.exists(output) and os.path.getmtime(output) >= video_mtime for output in outputs)
+
+
+def process_batch_video(video_path, options):
+    """
+    Worker entry point of batch mode: process one video and time it.
+    """
+    started = time.perf_counter()
+    stats = extract_frames(video_path, **options)
+    seconds = time.perf_counter() - started
+    if stats is None:
+        return {"status": "failed", "seconds": seconds}
+    return dict(stats, status="cached" if stats.pop("cached") else "done", seconds=seconds)
+
+
+def extract_frames_batch(video_paths, jobs=1, force=False, summary_path=None, **options):
+    """
+    Process a batch of videos on a pool of jobs processes, sharing one loaded reference image.
+    Videos whose outputs are all newer than the video are skipped unless force is set.
+    Writes one summary row per video (frames, intervals, seconds, fps achieved) to summary_path.
+    """
+    reference_path = KUROYURI_PATH
+    if not os.path.exists(reference_path):
+        print(f"Error: Reference image not found at: {reference_path}")
+        return None
+    options["reference_image"] = cv2.imread(reference_path, cv2.IMREAD_GRAYSCALE)
+
+    summary = {}
+    todo = []
+    for video_path in video_paths:
+        if not os.path.exists(video_path):
+            summary[video_path] = {"status": "missing"}
+        elif not force and is_up_to_date(video_path, batch_outputs(
+                video_path, options.get("slides"), options.get("generate_ass"))):
+            summary[video_path] = {"status": "skipped"}
+        else:
+            todo.append(video_path)
+    print(f"Batch: {len(todo)} of {len(video_paths)} videos to process with {jobs} jobs")
+
+    if jobs > 1 and len(todo) > 1:
+        stage_profiler.note("Videos processed in --jobs processes are not included in any stage.")
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {video_path: executor.submit(process_batch_video, video_path, options)
+                       for video_path in todo}
+            for video_path, future in futures.items():
+                try:
+                    summary[video_path] = future.result()
+                except Exception as e:
+                    summary[video_path] = {"status": f"error: {e}"}
+    else:
+        for video_path in todo:
+            # Like the pool above, one failing video must not stop the rest of the batch
+            try:
+                summary[video_path] = process_batch_video(video_path, options)
+            except Exception as e:
+                print(f"Error: Failed to process {os.path.basename(video_path)}: {e}")
+                summary[video_path] = {"status": f"error: {e}"}
+
+    rows = []
+    for video_path in video_paths:
+        result = summary[video_path]
+        frames, seconds = result.get("frames"), result.get("seconds")
+        rows.append([video_path, result["status"], frames, result.get("intervals"),
+                     f"{seconds:.2f}" if seconds is not None else None,
+                     f"{frames / seconds:.1f}" if frames and seconds else None])
+    header = ["Video", "Status", "Frames", "Intervals", "Seconds", "FPS"]
+    if summary_path:
+        with open(summary_path, mode="w", newline="", encoding="utf-8") as summary_file:
+            writer = csv.writer(summary_file)
+            writer.writerow(header)
+            writer.writerows(rows)
+    print(f"{'status':>8} {'frames':>8} {'intervals':>9} {'seconds':>8} {'fps':>8}  video")
+    for video_path, status, frames, intervals, seconds, fps in rows:
+        print(f"{status:>8} {frames or '':>8} {intervals or '':>9} {seconds or '':>8} {fps or '':>8}  "
+              f"{os.path.basename(video_path)}")
+    if summary_path:
+        print(f"Batch summary written to {summary_path}")
+    return summary
+
+
+def report_detection_scales(video_path, scales):
+    """
+    Compare similarity traces computed on downscaled streams with the full-resolution trace
+    in a single decoding pass, and report which scales still yield identical intervals.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print("Error: Cannot open video file.")
+        return None
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_width, frame_height = get_video_resolution(video_path)
+    if frame_width is None or frame_height is None:
+        print("Error: Unable to determine video resolution using FFmpeg.")
+        cap.release()
+        return None
+    preset_key = is_valid_aspect_ratio(frame_width, frame_height)
+    if preset_key is None:
+        print("Error: Unsupported aspect ratio.")
+        cap.release()
+        return None
+    preset = CONFIG_PRESETS[preset_key]
+    reference_image = cv2.imread(KUROYURI_PATH, cv2.IMREAD_GRAYSCALE)
+
+    scales = [1.0] + sorted((scale for scale in scales if 0 < scale < 1), reverse=True)
+    regions = [detection_region(preset, frame_width, frame_height, scale) for scale in scales]
+    engines = [SimilarityEngine(reference_image) for _ in scales]
+    traces = [[] for _ in scales]
+    frame_count = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        for ((x1, y1, x2, y2), detect_size), engine, trace in zip(regions, engines, traces):
+            yuri_binary = prepare_roi(shrink_roi(frame[y1:y2, x1:x2], detect_size), frame_count)
+            if engine.add(yuri_binary):
+                trace.extend(engine.flush())
+        frame_count += 1
+    cap.release()
+    if not frame_count:
+        print("Error: No frames could be read from the video.")
+        return None
+
+    report = []
+    full_trace = None
+    full_intervals = None
+    for scale, (_, detect_size), engine, trace in zip(scales, regions, engines, traces):
+        trace.extend(engine.flush())
+        trace = np.array(trace, dtype=np.float64)
+        intervals = detect_intervals(trace, trace.max() * THRESHOLD_RATIO, fps)
+        if full_trace is None:
+            full_trace, full_intervals = trace, intervals
+        boundary_shift = max((round(abs(a - b) * fps) for full, scaled in zip(full_intervals, intervals)
+                              for a, b in zip(full, scaled)), default=0)
+        report.append({
+            "scale": scale,
+            "region": list(detect_size) if detect_size else None,
+            "max_abs_diff": float(np.abs(trace - full_trace).max()),
+            "mean_abs_diff": float(np.abs(trace - full_trace).mean()),
+            "correlation": float(np.corrcoef(trace, full_trace)[0, 1]) if trace.std() and full_trace.std() else 1.0,
+            "intervals": len(intervals),
+            "max_boundary_shift_frames": boundary_shift,
+            "identical": intervals == full_intervals,
+        })
+
+    print(f"Preset {preset_key}, {frame_count} frames, {len(full_intervals)} intervals at full resolution")
+    print(f"{'scale':>6} {'region':>9} {'max|diff|':>10} {'mean|diff|':>11} {'corr':>8} {'intervals':>10} {'shift':>6}  identical")
+    for row in report:
+        region = "x".join(map(str, row["region"])) if row["region"] else "full"
+        print(f"{row['scale']:>6g} {region:>9} {row['max_abs_diff']:>10.4f} {row['mean_abs_diff']:>11.4f} "
+              f"{row['correlation']:>8.4f} {row['intervals']:>10} {row['max_boundary_shift_frames']:>6}  {row['identical']}")
+    safe = [row["scale"] for row in report if row["identical"]]
+    print(f"Lowest scale with identical intervals: {min(safe):g}")
+    return report
+
+
+def default_profile_path(args):
+    if args.input_dir or args.manifest:
+        summary_dir = args.input_dir or os.path.dirname(os.path.abspath(args.manifest))
+        return os.path.join(summary_dir, "batch.profile.json")
+    if args.input == "-":
+        return "stdin.profile.json"
+    return os.path.splitext(args.input)[0] + ".profile.json"
 
 
 if __name__ == "__main__":
     args = parse_args()
-    extract_frames(args.input, args.debug, args.slides, args.enable_merge, args.ass)
\ No newline at end of file
+    if args.debug_archive:
+        args.debug = True
+    profiler = stage_profiler.enable() if args.profile else None
+    if args.input_dir or args.manifest:
+        if args.debug or args.stream or args.raw_size or args.scale_report:
+            print("Error: Batch mode does not support --debug, --stream, --raw-size or --scale-report.")
+            sys.exit(1)
+        summary_dir = args.input_dir or os.path.dirname(os.path.abspath(args.manifest))
+        extract_frames_batch(
+            list_batch_videos(args.input_dir, args.manifest), args.jobs, args.force,
+            os.path.join(summary_dir, "batch_summary.csv"),
+            debug=False, slides=args.slides, enable_merge=args.enable_merge, generate_ass=args.ass,
+            decoder=args.decoder, workers=args.workers, stride=args.stride, max_stride=args.max_stride,
+            use_cache=not args.no_cache, detect_scale=args.detect_scale, roi_gate=not args.no_roi_gate,
+            dedupe=args.dedupe, hash_index=args.hash_index and os.path.abspath(args.hash_index),
+            threshold=args.threshold)
+    elif args.scale_report:
+        report_detection_scales(args.input, args.scale_report)
+    elif args.ocr and not (args.stream or args.raw_size):
+        print("Error: --ocr runs in streaming mode; add --stream with --threshold or --warmup-frames.")
+        sys.exit(1)
+    elif args.stream or args.raw_size:
+        extract_frames_streaming(args.input, args.debug, args.slides, args.ass, args.decoder,
+                                 args.threshold, args.warmup_frames, args.raw_size, args.raw_fps,
+                                 args.detect_scale, not args.no_roi_gate, args.debug_archive, args.ocr, args.chn)
+    else:
+        extract_frames(args.input, args.debug, args.slides,
+                       args.enable_merge, args.ass, args.decoder, args.workers,
+                       args.stride, args.max_stride, not args.no_cache, args.detect_scale,
+                       not args.no_roi_gate, args.debug_archive, dedupe=args.dedupe, hash_index=args.hash_index,
+                       threshold=args.threshold)
+    if profiler is not None:
+        profiler.report(args.profile if isinstance(args.profile, str) else default_profile_path(args))
@@ -1,9 +1,23 @@
 import os
 import argparse
+import csv
+import hashlib
+import json
+import sqlite3
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import cv2
+import numpy as np
+import paddleocr
 from paddleocr import PaddleOCR
+import stage_profiler
+import term_replace
 import Levenshtein
 import pandas as pd
-from translate import Translator
+import ocr_service
+import translation
 
 name_mapping = {
     "オズ": "Oz", "アーサー": "Arthur", "カイン": "Cain", "リケ": "Riquet", "スノウ": "Snow",
@@ -18,38 +32,79 @@ name_mapping = {
     "アレク": "Alec",
 }
 
-def extract_text_from_image(image_path, ocr, seq):
-    def replace_names_in_text(text, mapping):
-        for jp_name, en_name in mapping.items():
-            text = text.replace(jp_name, en_name)
-        return text
+# Replaces every name of name_mapping in one pass, longest name first
+name_replacer = term_replace.TermReplacer(name_mapping)
 
-    result = ocr.ocr(image_path, cls=True)
+# PaddleOCR settings, also part of the OCR cache key
+OCR_OPTIONS = {
+    "use_angle_cls": True,  # Keep angle classification for rotated text
+    "lang": "japan",
+    "drop_score": 0.8,  # Filter low-confidence recognition results
+    "use_dilation": True,  # Enhance character edges to improve recognition
+}
 
-    if not result or result == [None]:
-        print(f"[LOG] Subtitle {seq}: No text detected")
-        return "", ""
+# Contiguous shards handed to each --workers process, so slow slides balance out
+SHARDS_PER_WORKER = 4
+
+# Bump when the way raw lines are read changes, to invalidate existing OCR caches
+OCR_CACHE_VERSION = 1
+
+# --layout: slides whose gray levels vary less than this standard deviation are blank
+LAYOUT_BLANK_STD = 8.0
+# --layout: rows with at least this share of ink pixels belong to a text line
+LAYOUT_ROW_INK = 0.002
+# --layout: text rows separated by gaps up to this share of the slide height form one line
+LAYOUT_LINE_GAP = 0.02
+# --layout: lines lower than this share of the slide height, or narrower than half their height, are noise
+LAYOUT_MIN_LINE_HEIGHT = 0.03
+# --layout: pixels of background kept around each line crop
+LAYOUT_PADDING = 4
+# --layout: ignore ink connected to the left or right slide edge, such as the kuroyuri icon in a
+# corner of the dialogue box; text lines beside it are still split and read
+LAYOUT_DROP_EDGE_INK = True
 
-    extracted_lines = [word_info[1][0]
-                       for line in result for word_info in line]
+def extract_text_from_image(image_path, ocr, seq):
+    crops = detect_text_lines(ocr, image_path)
+    (_, lines), = read_detected_slides(ocr, [(seq, crops)])
+    return format_slide(seq, lines)
+
+
+def format_slide(seq, lines):
+    """
+    Turn the raw lines read from one slide (see read_detected_slides) into its
+    formatted text and potential speaker, dropping low-confidence lines.
+    """
+    drop_score = OCR_OPTIONS["drop_score"]
+    extracted_lines = [text for text, score in lines["cls"] if score >= drop_score]
     if not extracted_lines:
+        print(f"[LOG] Subtitle {seq}: No text detected")
         return "", ""
 
+    # Both passes' confidences, to check that skipping the unchanged lines loses nothing
+    secondary = lines["no-cls"] if lines["no-cls"] is not None else lines["cls"]
+    first_scores = " ".join(f"{score:.3f}" for _, score in lines["cls"])
+    second_scores = (" ".join(f"{score:.3f}" for _, score in secondary) if lines["no-cls"] is not None
+                     else "same (no line flipped)")
+    print(f"[LOG] Subtitle {seq}: Confidence cls [{first_scores}] no-cls [{second_scores}]")
+    secondary_lines = [text for text, score in secondary if score >= drop_score]
+    return format_extracted_text(seq, extracted_lines, secondary_lines)
+
+
+def format_extracted_text(seq, extracted_lines, secondary_lines):
+    """
+    Build the "seq-speaker：text" line of one slide from the lines recognized with the
+    angle classifier and those recognized without it.
+    """
     potential_speaker = extracted_lines[0]
     if potential_speaker in name_mapping:
         speaker = name_mapping[potential_speaker]
         content = " ".join(extracted_lines[1:]) if len(
             extracted_lines) > 1 else ""
-        content = replace_names_in_text(content, name_mapping)
+        content = name_replacer.replace(content)
         formatted_text = f"{seq}-{speaker}：{content}"
     else:
         formatted_text = f"{seq}：{' '.join(extracted_lines)}"
 
-    # Perform secondary single-line OCR for additional accuracy
-    second_result = ocr.ocr(image_path, cls=False)
-    secondary_lines = [word_info[1][0]
-                       for line in second_result for word_info in line]
-
     if secondary_lines:
         combined_text = " ".join(secondary_lines)
 
@@ -63,36 +118,653 @@ def extract_text_from_image(image_path, ocr, seq):
     return formatted_text, potential_speaker
 
 
-def process_images_to_csv(slides_path, ocr, translate_to_chn):
-    data = []
-    for seq in range(1, 10000):  # Assuming a range for seq
-        image_filename = f"{seq:04d}.png"
-        image_path = os.path.join(slides_path, image_filename)
-
-        if os.path.exists(image_path):
-            extracted_text, _ = extract_text_from_image(image_path, ocr, seq)
-
-            # remove seq- prefix
-            if "：" in extracted_text:
-                _, extracted_text = extracted_text.split("：", 1)
-
-            row = {
-                "seq": str(seq),
-                "recognized_japanese": extracted_text
-            }
-
-            # Translate to Chinese only if enabled
-            if translate_to_chn:
-                translated_text = translate_japanese_to_chinese(
-                    extracted_text)
-                row["translated_chinese"] = translated_text
+def sorted_text_boxes(boxes):
+    """
+    Order detected boxes top to bottom, then left to right within a 10px row, the same way
+    PaddleOCR orders them before recognition.
+    """
+    ordered = sorted(boxes, key=lambda box: (box[0][1], box[0][0]))
+    for i in range(len(ordered) - 1):
+        for j in range(i, -1, -1):
+            if abs(ordered[j + 1][0][1] - ordered[j][0][1]) < 10 and ordered[j + 1][0][0] < ordered[j][0][0]:
+                ordered[j], ordered[j + 1] = ordered[j + 1], ordered[j]
+            else:
+                break
+    return ordered
+
+
+def crop_text_box(image, points):
+    # Perspective-corrected crop of one detected quadrilateral, as fed to the recognizer
+    width = int(max(np.linalg.norm(points[0] - points[1]), np.linalg.norm(points[2] - points[3])))
+    height = int(max(np.linalg.norm(points[0] - points[3]), np.linalg.norm(points[1] - points[2])))
+    target = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    matrix = cv2.getPerspectiveTransform(points, target)
+    crop = cv2.warpPerspective(image, matrix, (width, height),
+                               borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC)
+    if crop.shape[0] * 1.0 / crop.shape[1] >= 1.5:
+        crop = np.rot90(crop)
+    return crop
+
+
+def detect_text_lines(ocr, image):
+    """
+    Run text detection only on one slide (a path or a BGR image) and return the crops
+    of its text lines in reading order.
+    """
+    if isinstance(image, str):
+        image = cv2.imread(image)
+    with stage_profiler.stage("detect_text_lines"):
+        boxes = ocr.ocr(image, det=True, rec=False, cls=False)[0]
+    if not boxes:
+        return []
+    return [crop_text_box(image, box) for box in sorted_text_boxes(list(np.array(boxes, dtype=np.float32)))]
+
+
+def split_text_lines(image):
+    """
+    Layout-based replacement for detect_text_lines on the fixed dialogue box: split a slide
+    (a path or a BGR image) into text-line crops, top to bottom, using horizontal and vertical
+    ink projection profiles. Returns no crops for a blank slide.
+    """
+    if isinstance(image, str):
+        image = cv2.imread(image)
+    with stage_profiler.stage("split_text_lines"):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if gray.std() < LAYOUT_BLANK_STD:
+            return []
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        # Text is the minority side of the Otsu split, whether it is dark on light or the reverse
+        ink = binary == 0 if np.count_nonzero(binary) * 2 > binary.size else binary > 0
+        height, width = ink.shape
+        if LAYOUT_DROP_EDGE_INK:
+            # Remove the blobs touching the left or right edge before projecting, rather than the
+            # whole band they share rows with, so a text line beside the icon keeps its crop
+            _, labels, stats, _ = cv2.connectedComponentsWithStats(ink.astype(np.uint8), connectivity=8)
+            lefts = stats[:, cv2.CC_STAT_LEFT]
+            at_edge = (lefts == 0) | (lefts + stats[:, cv2.CC_STAT_WIDTH] == width)
+            at_edge[0] = False  # background
+            ink &= ~at_edge[labels]
+        text_rows = ink.sum(axis=1) >= max(1, LAYOUT_ROW_INK * width)
+
+        bands = []
+        max_gap = LAYOUT_LINE_GAP * height
+        for row in np.flatnonzero(text_rows):
+            if bands and row - bands[-1][1] <= max_gap + 1:
+                bands[-1][1] = row + 1
+            else:
+                bands.append([row, row + 1])
+
+        crops = []
+        for top, bottom in bands:
+            if bottom - top < LAYOUT_MIN_LINE_HEIGHT * height:
+                continue
+            columns = np.flatnonzero(ink[top:bottom].any(axis=0))
+            left, right = columns[0], columns[-1] + 1
+            # Skip specks narrower than half a line
+            if right - left < (bottom - top) / 2:
+                continue
+            crops.append(image[max(0, top - LAYOUT_PADDING):min(height, bottom + LAYOUT_PADDING),
+                               max(0, left - LAYOUT_PADDING):min(width, right + LAYOUT_PADDING)])
+        return crops
+
+
+def layout_settings():
+    return {"blank_std": LAYOUT_BLANK_STD, "row_ink": LAYOUT_ROW_INK, "line_gap": LAYOUT_LINE_GAP,
+            "min_line_height": LAYOUT_MIN_LINE_HEIGHT, "padding": LAYOUT_PADDING,
+            "drop_edge_ink": LAYOUT_DROP_EDGE_INK}
+
+
+def find_text_lines(ocr, image, layout=False):
+    # Text-line crops of one slide, from the detection model or, with layout, from split_text_lines
+    return split_text_lines(image) if layout else detect_text_lines(ocr, image)
+
+
+def classify_text_lines(ocr, crops):
+    """
+    Run the angle classifier over text-line crops. Returns the crops turned upright and
+    the indices of the lines it flipped by 180 degrees.
+    """
+    classifier = getattr(ocr, "text_classifier", None)
+    if classifier is None or not crops:
+        return list(crops), []
+    with stage_profiler.stage("classify_text_lines"):
+        upright, labels, _ = classifier(list(crops))
+    threshold = getattr(classifier, "cls_thresh", 0.9)
+    flipped = [index for index, (label, score) in enumerate(labels) if "180" in label and score > threshold]
+    return upright, flipped
+
+
+def recognize_text_lines(ocr, crops, pass_name):
+    """
+    Recognize a list of text-line crops in one call; the recognizer splits it into forward
+    passes of rec_batch_num lines. Returns (text, score) per crop.
+    """
+    if not crops:
+        return []
+    # Not ocr.ocr(crops, det=False): it takes a list as separate pages, recognizes them one
+    # by one and keeps its page count from the first call, truncating longer lists later
+    with stage_profiler.stage(f"recognize_text_lines[{pass_name}]"):
+        lines, _ = ocr.text_recognizer(list(crops))
+    if len(lines) != len(crops):
+        raise RuntimeError(f"Recognizer returned {len(lines)} results for {len(crops)} text lines")
+    return lines
+
+
+def reread_flipped_lines(ocr, crops, first, flipped):
+    """
+    Results of the secondary pass without the angle classifier. It can only read differently
+    the lines the classifier flipped, so just those crops are recognized again as detected.
+    """
+    second = list(first)
+    for index, line in zip(flipped, recognize_text_lines(ocr, [crops[index] for index in flipped], "no-cls")):
+        second[index] = line
+    return second
+
+
+def read_detected_slides(ocr, pending, classify=True):
+    """
+    Recognize the detected text-line crops of (seq, crops) slides in one batch.
+    Yields (seq, lines) in order, where lines holds the raw [text, score] of every
+    crop with ("cls") and without ("no-cls") the angle classifier; "no-cls" is None
+    when it reads the same, as it always does without classify.
+    """
+    drop_score = OCR_OPTIONS["drop_score"]
+    crops = [crop for _, slide_crops in pending for crop in slide_crops]
+    upright, flipped = classify_text_lines(ocr, crops) if classify else (crops, [])
+    first = [[text, float(score)] for text, score in recognize_text_lines(ocr, upright, "cls")]
+
+    slices = []
+    offset = 0
+    for _, slide_crops in pending:
+        slices.append(slice(offset, offset + len(slide_crops)))
+        offset += len(slide_crops)
+
+    # Like before, the secondary pass is only needed for slides with text
+    with_text = {index for lines in slices if any(score >= drop_score for _, score in first[lines])
+                 for index in range(lines.start, lines.stop)}
+    flipped = [index for index in flipped if index in with_text]
+    second = [[text, float(score)] for text, score in reread_flipped_lines(ocr, crops, first, flipped)]
+
+    for (seq, _), lines in zip(pending, slices):
+        rerun = any(lines.start <= index < lines.stop for index in flipped)
+        yield seq, {"cls": first[lines], "no-cls": second[lines] if rerun else None}
+
+
+def read_slides_batched(ocr, slides, batch_size, layout=False):
+    """
+    Read (seq, image) slides by pooling the text lines detected on consecutive slides
+    until at least batch_size lines are pending, so recognition runs over full batches
+    instead of one slide's few lines at a time. Yields (seq, lines) in order.
+    """
+    pending = []
+    pending_lines = 0
+    for seq, image in slides:
+        pending.append((seq, find_text_lines(ocr, image, layout)))
+        pending_lines += len(pending[-1][1])
+        if pending_lines >= batch_size:
+            yield from read_detected_slides(ocr, pending, not layout)
+            pending, pending_lines = [], 0
+    if pending:
+        yield from read_detected_slides(ocr, pending, not layout)
+
+
+def read_slides(ocr, slides, batch_size=0, layout=False):
+    """
+    Yield (seq, lines) for (seq, image) slides in order, slide by slide or,
+    with batch_size, through read_slides_batched. With layout, lines are split by
+    split_text_lines and recognized directly, without detection or angle classification.
+    """
+    if batch_size > 0:
+        yield from read_slides_batched(ocr, slides, batch_size, layout)
+        return
+    for seq, image in slides:
+        with stage_profiler.stage("extract_text_from_image"):
+            (_, lines), = read_detected_slides(ocr, [(seq, find_text_lines(ocr, image, layout))], not layout)
+        yield seq, lines
+
+
+_worker_ocr = None
+
+
+def _init_ocr_worker(rec_batch_num, cpu_threads):
+    # Load the models once per worker process, sized to its share of the cores
+    global _worker_ocr
+    os.environ["OMP_NUM_THREADS"] = str(cpu_threads)
+    cv2.setNumThreads(1)
+    _worker_ocr = create_ocr(rec_batch_num, cpu_threads)
+
+
+def _read_shard(slides, batch_size, layout):
+    return list(read_slides(_worker_ocr, slides, batch_size, layout))
+
+
+def read_slides_parallel(slides, batch_size, workers, layout=False):
+    """
+    Shard slides into contiguous runs across a pool of workers processes, each with its own
+    PaddleOCR using cpu_count // workers threads. Yields (seq, lines) in order.
+    """
+    cpu_threads = max(1, (os.cpu_count() or 1) // workers)
+    shard_count = min(len(slides), workers * SHARDS_PER_WORKER)
+    shard_size = -(-len(slides) // shard_count) if shard_count else 1
+    shards = [slides[i:i + shard_size] for i in range(0, len(slides), shard_size)]
+    print(f"Recognizing {len(slides)} slides in {len(shards)} shards with {workers} workers, "
+          f"{cpu_threads} CPU threads each")
+    stage_profiler.note("Stages inside the --workers processes are not included; "
+                        "their time only shows in read_slides.")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_ocr_worker,
+                             initargs=(batch_size or None, cpu_threads)) as executor:
+        for result in executor.map(_read_shard, shards, [batch_size] * len(shards), [layout] * len(shards)):
+            yield from result
+
+
+def ocr_config():
+    # Everything besides the slide pixels that decides the raw lines read from a slide
+    return {"version": OCR_CACHE_VERSION, "paddleocr": getattr(paddleocr, "__version__", None),
+            "options": OCR_OPTIONS}
+
+
+class OcrCache:
+    """
+    SQLite store of the raw lines read from slides, keyed by a hash of the slide pixels
+    and the OCR configuration. Formatting is re-applied on every run, so changes to
+    name_mapping or the post-processing do not need new inference.
+    """
+
+    def __init__(self, path, layout=False):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS ocr_lines (key TEXT PRIMARY KEY, lines TEXT NOT NULL)")
+        self.config = json.dumps({**ocr_config(), "layout": layout_settings() if layout else None},
+                                 sort_keys=True)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, image):
+        digest = hashlib.blake2b(self.config.encode(), digest_size=20)
+        digest.update(str(image.shape).encode())
+        digest.update(np.ascontiguousarray(image).tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        row = self.connection.execute("SELECT lines FROM ocr_lines WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, lines):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO ocr_lines (key, lines) VALUES (?, ?)",
+                                    (key, json.dumps(lines, ensure_ascii=False)))
+
+    def close(self):
+        self.connection.close()
+
+    def report(self):
+        lookups = self.hits + self.misses
+        rate = f"{self.hits / lookups:.1%}" if lookups else "n/a"
+        print(f"OCR cache: {self.hits} hits, {self.misses} misses ({rate} hit rate) in {self.path}")
+
+
+def ocr_results_csv_path(slides_path):
+    slides_folder_name = os.path.basename(os.path.normpath(slides_path))
+    csv_filename = f"{slides_folder_name.replace('-slides', '')}-ocr-results.csv" if '-slides' in slides_folder_name else "-ocr-results.csv"
+    return os.path.join(os.path.dirname(slides_path), csv_filename)
+
+
+def load_dedupe_mapping(slides_path):
+    """
+    Read the {seq: source} duplicates written by 02_frame.py --dedupe, if any.
+    A source is {"seq": n} for an earlier slide of the same video, or
+    {"slides": dir, "seq": n} for a slide of another episode.
+    """
+    try:
+        with open(os.path.join(slides_path, "_dedupe.json"), encoding="utf-8") as dedupe_file:
+            duplicates = json.load(dedupe_file)["duplicates"]
+    except (OSError, ValueError, KeyError):
+        return {}
+    return {int(seq): source for seq, source in duplicates.items()}
+
+
+def load_episode_rows(slides_path, cache):
+    # Rows of another episode's OCR results, by seq
+    if slides_path not in cache:
+        csv_path = ocr_results_csv_path(slides_path)
+        rows = {}
+        if os.path.exists(csv_path):
+            rows = {int(row["seq"]): row for row in pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+                    .to_dict("records")}
+        cache[slides_path] = rows
+    return cache[slides_path]
+
+
+def find_duplicate_row(source, rows_by_seq, episode_rows, translate_to_chn):
+    # The row a duplicate slide can reuse, or None if it has to be recognized after all
+    if "slides" in source:
+        source_row = load_episode_rows(source["slides"], episode_rows).get(source["seq"])
+    else:
+        source_row = rows_by_seq.get(source["seq"])
+    if source_row is not None and (not translate_to_chn or "translated_chinese" in source_row):
+        return source_row
+    return None
+
+
+def list_slide_images(slides_path):
+    """
+    Return [(seq, path, (size, mtime_ns))] for the NNNN.png slides of a folder, in seq
+    order, from a single directory scan.
+    """
+    slides = []
+    with os.scandir(slides_path) as entries:
+        for entry in entries:
+            stem, extension = os.path.splitext(entry.name)
+            if extension == ".png" and stem.isdigit() and entry.is_file():
+                stat = entry.stat()
+                slides.append((int(stem), entry.path, (stat.st_size, stat.st_mtime_ns)))
+    slides.sort()
+    return slides
+
+
+def ocr_manifest_path(csv_path):
+    return csv_path.replace("-ocr-results.csv", "-ocr-manifest.jsonl") if csv_path.endswith(
+        "-ocr-results.csv") else csv_path + ".manifest.jsonl"
+
+
+class OcrManifest:
+    """
+    Append-only JSON-lines record of the rows written for each slide, after a
+    {"settings": ...} header. A restarted run reuses the row of every slide whose file
+    size and mtime are unchanged; later lines win. Written under other settings,
+    the whole manifest is discarded.
+    """
+
+    def __init__(self, path, settings):
+        self.path = path
+        self.settings = settings
+        self.entries = self._load()
+        self.file = open(path, "a" if self.entries is not None else "w", encoding="utf-8")
+        if self.entries is None:
+            self.entries = {}
+            self._write({"settings": settings})
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as manifest_file:
+                header = json.loads(manifest_file.readline())
+                if header.get("settings") != self.settings:
+                    return None
+                entries = {}
+                for line in manifest_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # Torn last line of an interrupted run
+                    entries[entry["seq"]] = entry
+                return entries
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _write(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def lookup(self, seq, stat):
+        entry = self.entries.get(seq)
+        if entry is not None and entry["stat"] == list(stat):
+            return entry["row"]
+        return None
+
+    def record(self, seq, stat, row):
+        entry = {"seq": seq, "stat": list(stat), "row": row}
+        self.entries[seq] = entry
+        self._write(entry)
+
+    def close(self, seqs=None):
+        """
+        Close the manifest; given the seqs of a finished run, rewrite it with only those.
+        """
+        self.file.close()
+        if seqs is None:
+            return
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as manifest_file:
+            manifest_file.write(json.dumps({"settings": self.settings}, ensure_ascii=False) + "\n")
+            for seq in seqs:
+                manifest_file.write(json.dumps(self.entries[seq], ensure_ascii=False) + "\n")
+        os.replace(temp_path, self.path)
+
+
+def process_images_to_csv(slides_path, ocr, translator, csv_path, use_dedupe=True, batch_size=0,
+                          workers=1, cache=None, resume=True, layout=False, service=None):
+    """
+    Recognize the slides of a folder and stream their rows to csv_path in seq order,
+    translating them on the translator's pool (if given) while recognition goes on.
+    With service (an ocr_service client), slides are read by the resident OCR service.
+    With resume, rows recorded in the manifest next to the CSV for unchanged slides are
+    reused, and every new row is recorded as soon as it is written. Returns the row count.
+    """
+    translate_to_chn = translator is not None
+    rows_by_seq = {}
+    duplicates = load_dedupe_mapping(slides_path) if use_dedupe else {}
+    episode_rows = {}
+    with stage_profiler.stage("list_slide_images"):
+        slides = list_slide_images(slides_path)
+    slide_seqs = {seq for seq, _, _ in slides}
+
+    manifest = None
+    reused = {}
+    if resume:
+        manifest = OcrManifest(ocr_manifest_path(csv_path), {
+            "chn": translate_to_chn, "dedupe": use_dedupe, "ocr": OCR_OPTIONS, "names": name_mapping,
+            "layout": layout_settings() if layout else None})
+        for seq, _, stat in slides:
+            row = manifest.lookup(seq, stat)
+            if row is not None:
+                reused[seq] = row
+        if reused:
+            print(f"Resuming: {len(reused)} of {len(slides)} slides unchanged since the last run")
+
+    # Recognize every slide that will not reuse an earlier row
+    def needs_ocr(seq):
+        if seq in reused:
+            return False
+        source = duplicates.get(seq)
+        if source is None:
+            return True
+        if "slides" in source:
+            return find_duplicate_row(source, {}, episode_rows, translate_to_chn) is None
+        return source["seq"] not in slide_seqs
+
+    to_read = [(seq, image_path) for seq, image_path, _ in slides if needs_ocr(seq)]
+    read_lines = {}
+    cache_keys = {}
+    if cache is not None:
+        with stage_profiler.stage("ocr_cache.lookup"):
+            for seq, image_path in to_read:
+                cache_keys[seq] = cache.key(cv2.imread(image_path))
+                lines = cache.get(cache_keys[seq])
+                if lines is not None:
+                    read_lines[seq] = lines
+        to_read = [(seq, image_path) for seq, image_path in to_read if seq not in read_lines]
+
+    if service is not None:
+        results = service.read_slides(to_read, batch_size, layout)
+    elif workers > 1 and len(to_read) > 1:
+        results = read_slides_parallel(to_read, batch_size, workers, layout)
+    else:
+        if ocr is None and to_read:
+            ocr = create_ocr(batch_size or None)
+        results = read_slides(ocr, to_read, batch_size, layout)
+    results = stage_profiler.iterate("read_slides", results)
+
+    def wait_for_lines(seq):
+        # Results arrive in seq order, so pull them until this slide's
+        for result_seq, lines in results:
+            read_lines[result_seq] = lines
+            if cache is not None:
+                cache.put(cache_keys[result_seq], lines)
+            if result_seq == seq:
+                break
+        if seq not in read_lines:
+            # The reader stopped early, e.g. a worker process died or the service dropped the request
+            raise RuntimeError(f"OCR results ended before slide {seq} ({dict(to_read).get(seq)}) was read")
+        return read_lines.pop(seq)
 
-            data.append(row)
+    if os.path.exists(csv_path):
+        print(f"[WARNING] File {os.path.basename(csv_path)} already exists and will be overwritten.")
+    fieldnames = ["seq", "recognized_japanese"] + (["translated_chinese"] if translate_to_chn else [])
+    unwritten = deque()
+    finished = False
+    try:
+        with open(csv_path, "w", newline="", encoding="utf-8") as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames, extrasaction="ignore", lineterminator=os.linesep)
+            writer.writeheader()
+
+            def write_rows(wait=False):
+                # Rows go out in seq order as soon as their translation is done
+                while unwritten:
+                    seq, stat, row = unwritten[0]
+                    translated = row.get("translated_chinese")
+                    if not wait and isinstance(translated, Future) and not translated.done():
+                        return
+                    unwritten.popleft()
+                    finish_row(row)
+                    with stage_profiler.stage("write_csv"):
+                        writer.writerow(row)
+                        csv_file.flush()
+                    if manifest is not None and seq not in reused:
+                        manifest.record(seq, stat, row)
+
+            for seq, _, stat in slides:
+                row = reused.get(seq)
+                # Lines that 02_frame.py found to repeat an earlier slide reuse its results
+                source = duplicates.get(seq)
+                if row is None and source is not None and not needs_ocr(seq):
+                    if "slides" in source:
+                        source_row = find_duplicate_row(source, rows_by_seq, episode_rows, translate_to_chn)
+                    else:
+                        source_row = rows_by_seq[source["seq"]]
+                    print(f"[LOG] Subtitle {seq}: Duplicate of {source.get('slides', 'seq')} #{source['seq']}")
+                    # A translation still in progress is shared through its Future
+                    row = dict(source_row, seq=str(seq))
+                    if not translate_to_chn:
+                        row.pop("translated_chinese", None)
+                if row is None:
+                    lines = read_lines.pop(seq) if seq in read_lines else wait_for_lines(seq)
+                    extracted_text, _ = format_slide(seq, lines)
+                    row = build_row(seq, extracted_text, translator)
+
+                rows_by_seq[seq] = row
+                unwritten.append((seq, stat, row))
+                write_rows()
+            write_rows(wait=True)
+        finished = True
+    finally:
+        if manifest is not None:
+            # Only a finished run drops the entries of slides that are gone
+            manifest.close([seq for seq, _, _ in slides] if finished else None)
 
-    return data
+    print(f"Processed results saved as: {csv_path}")
+    return len(rows_by_seq)
 
 
-def translate_japanese_to_chinese(japanese_text):
+def build_row(seq, extracted_text, translator=None):
+    """
+    Turn the text of one slide into its CSV row. With a translator, the row's
+    "translated_chinese" is a Future of the translation until finish_row() is called.
+    """
+    # remove seq- prefix
+    if "：" in extracted_text:
+        _, extracted_text = extracted_text.split("：", 1)
+
+    row = {
+        "seq": str(seq),
+        "recognized_japanese": extracted_text
+    }
+
+    # Translate to Chinese only if enabled
+    if translator is not None:
+        row["translated_chinese"] = translate_japanese_to_chinese(extracted_text, translator)
+    return row
+
+
+def finish_row(row):
+    """
+    Wait for the translation of a row from build_row(), if any, and return the row.
+    """
+    translated = row.get("translated_chinese")
+    if isinstance(translated, Future):
+        with stage_profiler.stage("translate_japanese_to_chinese.wait"):
+            row["translated_chinese"] = translated.result()
+        # print translated Chinese text
+        print(f"[LOG] Subtitle {row['seq']}: Translated Chinese: {row['translated_chinese']}")
+    return row
+
+
+class OcrPipeline:
+    """
+    Recognize in-memory slide crops on a background thread while they are still being produced,
+    so no PNG round trip is needed. Slides are processed in submission order through a bounded
+    queue (submit() blocks while it is full); on_result(seq, row, payload) is called on the
+    worker thread after each one.
+    """
+
+    def __init__(self, ocr, translate_to_chn=False, on_result=None, queue_size=8):
+        self.ocr = ocr
+        self.translator = translation.TranslationClient() if translate_to_chn else None
+        self.on_result = on_result
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.rows = []
+        self.thread = threading.Thread(target=self._run, name="ocr-pipeline", daemon=True)
+        self.thread.start()
+
+    def submit(self, seq, image, payload=None):
+        """
+        Queue one BGR slide crop (or None if the slide could not be captured).
+        """
+        self.queue.put((seq, image, payload))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            seq, image, payload = item
+            extracted_text = ""
+            if image is None:
+                print(f"[WARNING] Subtitle {seq}: No slide image to recognize, writing the line without text")
+            else:
+                try:
+                    with stage_profiler.stage("extract_text_from_image"):
+                        extracted_text, _ = extract_text_from_image(image, self.ocr, seq)
+                except Exception as e:
+                    print(f"[ERROR] Subtitle {seq}: OCR failed: {e}")
+            try:
+                row = finish_row(build_row(seq, extracted_text, self.translator))
+            except Exception as e:
+                print(f"[ERROR] Subtitle {seq}: Translation failed: {e}")
+                row = dict(build_row(seq, extracted_text), translated_chinese="")
+            self.rows.append(row)
+            if self.on_result is not None:
+                self.on_result(seq, row, payload)
+
+    def close(self):
+        """
+        Wait for every queued slide and return the rows in order.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.translator is not None:
+            self.translator.close()
+        return self.rows
+
+
+def translate_japanese_to_chinese(japanese_text, translator):
+    """
+    Queue the translation of one line on the translator's pool; returns a Future.
+    """
     # print original extracted Japanese text
     print(f"[LOG] Original Extracted Japanese: {japanese_text}")
 
@@ -103,13 +775,29 @@ def translate_japanese_to_chinese(japanese_text):
     # pinrt optimized Japanese text for translation input
     print(f"[LOG] Processed Japanese for Translation: {japanese_text}")
 
-    # use translate package to translate Japanese to Chinese
-    translator = Translator(from_lang="ja", to_lang="zh")
-    translated_text = translator.translate(japanese_text)
+    return translator.submit(japanese_text)
 
-    # print translated Chinese text
-    print(f"[LOG] Translated Chinese: {translated_text}")
-    return translated_text
+
+def create_ocr(rec_batch_num=None, cpu_threads=None):
+    options = {}
+    if rec_batch_num:
+        options["rec_batch_num"] = rec_batch_num  # Text lines per recognition forward pass
+    if cpu_threads:
+        options["cpu_threads"] = cpu_threads  # Inference threads, split between --workers processes
+    with stage_profiler.stage("PaddleOCR.__init__"):
+        return PaddleOCR(**OCR_OPTIONS, **options)
+
+
+def write_results_csv(data, csv_path):
+    csv_filename = os.path.basename(csv_path)
+    if os.path.exists(csv_path):
+        print(f"[WARNING] File {csv_filename} already exists and will be overwritten.")
+
+    with stage_profiler.stage("write_csv"):
+        df = pd.DataFrame(data)
+        df.to_csv(csv_path, index=False)
+
+    print(f"Processed results saved as: {csv_path}")
 
 
 def main():
@@ -117,32 +805,104 @@ def main():
         description="Process images to extract OCR results and save as CSV.",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
-    parser.add_argument("--slides", required=True,
-                        help="Path to the slides folder containing PNG images.")
+    parser.add_argument("--slides",
+                        help="Path to the slides folder containing PNG images (required unless --serve).")
     parser.add_argument("--chn", action="store_true",
                         help="Enable Chinese translation output.")
+    parser.add_argument("--translate-url", default=translation.MYMEMORY_URL,
+                        help="MyMemory-compatible translation endpoint used with --chn "
+                             "(e.g. tools/mock_translate.py for offline runs).")
+    parser.add_argument("--translate-workers", type=int, default=4, metavar="N",
+                        help="Translation requests in flight at once with --chn.")
+    parser.add_argument("--translate-rate", type=float, default=4.0, metavar="R",
+                        help="At most R translation requests per second with --chn (0: unlimited).")
+    parser.add_argument("--layout", action="store_true",
+                        help="Split the dialogue box into text lines with projection profiles and recognize them "
+                             "directly, skipping text detection and angle classification.")
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="Recognize every slide, ignoring the _dedupe.json written by 02_frame.py --dedupe.")
+    parser.add_argument("--batch-size", type=int, default=0, metavar="N",
+                        help="Detect text lines slide by slide but recognize the lines of many slides together, "
+                             "N lines per forward pass (0: recognize each slide on its own).")
+    parser.add_argument("--workers", type=int, default=1, metavar="N",
+                        help="Recognize slides in N processes, each loading its own PaddleOCR with an equal "
+                             "share of the CPU cores.")
+    parser.add_argument("--cache", default=None, metavar="SQLITE",
+                        help="OCR cache database, keyed by slide pixels and OCR settings "
+                             "(default: ocr-cache.sqlite next to the CSV).")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not read or write the OCR cache.")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Recognize every slide again instead of reusing the rows recorded in "
+                             "<name>-ocr-manifest.jsonl for slides unchanged since the last run.")
+    parser.add_argument("--serve", action="store_true",
+                        help="Load PaddleOCR once and answer OCR requests on --socket until interrupted, "
+                             "so later runs skip the model load.")
+    parser.add_argument("--socket", default=ocr_service.DEFAULT_SOCKET, metavar="PATH",
+                        help="Unix socket of the OCR service; used when a service started with --serve "
+                             "listens there, otherwise slides are read in-process.")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="Read slides in-process even when an OCR service is running.")
+    parser.add_argument("--profile", nargs="?", const=True, default=None, metavar="JSON",
+                        help="Record wall time, calls and peak memory per processing stage, print a summary "
+                             "and write it as JSON (default: <name>-ocr-profile.json next to the CSV).")
 
     args = parser.parse_args()
-
-    ocr = PaddleOCR(
-        use_angle_cls=True,  # Keep angle classification for rotated text
-        lang='japan',
-        drop_score=0.8,  # Filter low-confidence recognition results
-        use_dilation=True  # Enhance character edges to improve recognition
-    )
-
-    data = process_images_to_csv(args.slides, ocr, args.chn)
-
-    slides_folder_name = os.path.basename(os.path.normpath(args.slides))
-    csv_filename = f"{slides_folder_name.replace('-slides', '')}-ocr-results.csv" if '-slides' in slides_folder_name else "-ocr-results.csv"
-    csv_path = os.path.join(os.path.dirname(args.slides), csv_filename)
-    if os.path.exists(csv_path):
-        print(f"[WARNING] File {csv_filename} already exists and will be overwritten.")
-    
-    df = pd.DataFrame(data)
-    df.to_csv(csv_path, index=False)
-
-    print(f"Processed results saved as: {csv_path}")
+    profiler = stage_profiler.enable() if args.profile else None
+
+    if args.batch_size < 0:
+        parser.error("--batch-size must be 0 or a positive number of text lines")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.translate_workers < 1:
+        parser.error("--translate-workers must be at least 1")
+    if args.serve:
+        ocr = create_ocr(args.batch_size or None)
+        try:
+            ocr_service.serve(args.socket, ocr_config(),
+                              lambda slides, batch_size, layout: read_slides(ocr, slides, batch_size, layout))
+        except OSError as e:
+            parser.error(f"--serve: {e}")
+        return
+    if not args.slides:
+        parser.error("--slides is required")
+    csv_path = ocr_results_csv_path(args.slides)
+    cache = None
+    if not args.no_cache:
+        cache = OcrCache(args.cache or os.path.join(os.path.dirname(csv_path), "ocr-cache.sqlite"), args.layout)
+
+    service = None
+    if not args.no_daemon and args.workers == 1:
+        service = ocr_service.connect(args.socket)
+        if service is not None and service.config != ocr_config():
+            print(f"[WARNING] OCR service at {args.socket} uses other OCR settings, reading in-process")
+            service.close()
+            service = None
+        if service is not None:
+            print(f"Reading slides with the OCR service at {args.socket}")
+
+    translator = None
+    if args.chn:
+        translator = translation.TranslationClient(args.translate_url, args.translate_workers, args.translate_rate)
+
+    try:
+        with stage_profiler.stage("process_images_to_csv"):
+            # The models are loaded only for slides missing from the cache, in the workers with --workers
+            process_images_to_csv(args.slides, None, translator, csv_path, not args.no_dedupe, args.batch_size,
+                                  args.workers, cache, not args.no_resume, args.layout, service)
+    finally:
+        if service is not None:
+            service.close()
+        if translator is not None:
+            translator.close()
+            print(f"Translation: {translator.requests} requests, {translator.failures} failed")
+
+    if cache is not None:
+        cache.report()
+        cache.close()
+    if profiler is not None:
+        profiler.report(args.profile if isinstance(args.profile, str)
+                        else csv_path.replace("-ocr-results.csv", "-ocr-profile.json"))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,197 @@
+"""
+Resident OCR service shared by 03_ocr.py (--serve and the client side) and tools/test_paddle.py.
+
+`python 03_ocr.py --serve` loads PaddleOCR once and answers on a Unix socket, so later
+runs skip the model load. Messages are JSON objects, one per line:
+
+    {"op": "hello"}                       -> {"config": {...}}
+    {"op": "read", "batch_size": N, "layout": false,
+     "slides": [{"seq": 1, "path": "/abs/0001.png"} | {"seq": 2, "image": "<base64 PNG>"}]}
+                                          -> {"seq": 1, "lines": {...}} per slide, in order, then {"done": true}
+
+Any failure is answered with {"error": "..."}. The config is the OCR configuration of the
+serving process, so clients can refuse a service that would read differently.
+"""
+import base64
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+
+import cv2
+import numpy as np
+
+# Per-user directory, so other users cannot take over the socket path before the service binds it
+SOCKET_DIR = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or os.path.join(os.path.expanduser("~"), ".cache"),
+                          "auto-tl")
+DEFAULT_SOCKET = os.path.join(SOCKET_DIR, "ocr.sock")
+# Seconds to wait for the service to accept a connection before falling back
+CONNECT_TIMEOUT = 2.0
+
+
+def send_message(stream, message):
+    stream.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+    stream.flush()
+
+
+def receive_message(stream):
+    line = stream.readline()
+    if not line:
+        raise ConnectionError("OCR service closed the connection")
+    return json.loads(line)
+
+
+def encode_slide(seq, image):
+    # Paths are read by the service itself; images in memory travel as PNG
+    if isinstance(image, str):
+        return {"seq": seq, "path": os.path.abspath(image)}
+    if isinstance(image, np.ndarray):
+        image = cv2.imencode(".png", image)[1].tobytes()
+    return {"seq": seq, "image": base64.b64encode(image).decode("ascii")}
+
+
+def decode_slide(slide):
+    if "path" in slide:
+        image = cv2.imread(slide["path"])
+        if image is None:
+            raise ValueError(f"Cannot read image {slide['path']}")
+        return slide["seq"], image
+    image = cv2.imdecode(np.frombuffer(base64.b64decode(slide["image"]), np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Cannot decode the image of slide {slide['seq']}")
+    return slide["seq"], image
+
+
+class OcrServiceClient:
+    def __init__(self, path, connection):
+        self.path = path
+        self.connection = connection
+        self.stream = connection.makefile("rwb")
+        send_message(self.stream, {"op": "hello"})
+        self.config = receive_message(self.stream)["config"]
+
+    def read_slides(self, slides, batch_size=0, layout=False):
+        """
+        Read (seq, image) slides on the service, where image is a path, a BGR image or the
+        bytes of an image file. Yields (seq, lines) in order, as read_slides in 03_ocr.py does.
+        """
+        send_message(self.stream, {"op": "read", "batch_size": batch_size, "layout": layout,
+                                   "slides": [encode_slide(seq, image) for seq, image in slides]})
+        while True:
+            reply = receive_message(self.stream)
+            if "error" in reply:
+                raise RuntimeError(f"OCR service failed: {reply['error']}")
+            if reply.get("done"):
+                return
+            yield reply["seq"], reply["lines"]
+
+    def close(self):
+        self.stream.close()
+        self.connection.close()
+
+
+def check_socket_dir(path):
+    """
+    Raise PermissionError unless the directory of the socket path belongs to the current user
+    and no one else can write to it, i.e. create or replace the socket.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    info = os.stat(directory)
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        raise PermissionError(f"Socket directory {directory} belongs to another user")
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"Socket directory {directory} is writable by other users")
+
+
+def connect(path=DEFAULT_SOCKET):
+    """
+    Connect to the OCR service listening on path; returns None when it is not running,
+    or when another user could have put it there.
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    try:
+        check_socket_dir(path)
+    except PermissionError as e:
+        print(f"[WARNING] Not using the OCR service at {path}: {e}")
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(CONNECT_TIMEOUT)
+    try:
+        connection.connect(path)
+        connection.settimeout(None)
+        return OcrServiceClient(path, connection)
+    except (OSError, ValueError, KeyError):
+        connection.close()
+        return None
+
+
+class _OcrRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                request = receive_message(self.rfile)
+            except (ConnectionError, ValueError):
+                return
+            try:
+                if request.get("op") == "hello":
+                    send_message(self.wfile, {"config": server.config})
+                    continue
+                if request.get("op") != "read":
+                    raise ValueError(f"Unknown op {request.get('op')!r}")
+                slides = [decode_slide(slide) for slide in request["slides"]]
+                # One model instance serves every client, one request at a time
+                with server.lock:
+                    for seq, lines in server.read_slides(slides, request.get("batch_size", 0),
+                                                         request.get("layout", False)):
+                        send_message(self.wfile, {"seq": seq, "lines": lines})
+                    server.slides += len(slides)
+                send_message(self.wfile, {"done": True})
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            except Exception as e:
+                print(f"[WARNING] OCR request failed: {e}")
+                try:
+                    send_message(self.wfile, {"error": str(e)})
+                except OSError:
+                    return
+
+
+class _OcrServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(path, config, read_slides):
+    """
+    Answer OCR requests on the Unix socket path until interrupted. read_slides(slides,
+    batch_size, layout) yields (seq, lines) for (seq, image) slides in order.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise OSError("Unix sockets are not available on this platform")
+    if os.path.abspath(path) == os.path.abspath(DEFAULT_SOCKET):
+        os.makedirs(SOCKET_DIR, mode=0o700, exist_ok=True)
+        os.chmod(SOCKET_DIR, 0o700)
+    check_socket_dir(path)
+    running = connect(path)
+    if running is not None:
+        running.close()
+        raise OSError(f"An OCR service is already listening on {path}")
+    if os.path.exists(path):
+        # Left behind by a service that did not shut down cleanly
+        os.unlink(path)
+    server = _OcrServer(path, _OcrRequestHandler)
+    server.config = config
+    server.read_slides = read_slides
+    server.lock = threading.Lock()
+    server.slides = 0
+    print(f"OCR service listening on {path}, Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{server.slides} slides read")
+    finally:
+        server.server_close()
+        os.unlink(path)
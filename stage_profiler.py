@@ -0,0 +1,161 @@
+"""
+Per-stage profiling shared by 02_frame.py and 03_ocr.py.
+
+Code marks its stages with `with stage_profiler.stage("name"):` (or wraps an iterator
+with `stage_profiler.iterate("name", iterable)` to time every next() call). Until
+enable() is called these are no-ops, so the markers can stay on hot paths.
+Once enabled, every stage records its cumulative wall time, call count and peak traced
+memory (tracemalloc, main thread only); report() prints a summary table and writes JSON.
+Stages run in worker processes are not recorded; code handing work to a process pool
+calls note() so the report says which stages leave that work out.
+"""
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_active = None
+_null_context = nullcontext()
+
+
+class StageProfiler:
+    def __init__(self, trace_memory=True):
+        self.stages = {}
+        self.notes = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.trace_memory = trace_memory
+        self.started = time.perf_counter()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _record(self, name, seconds, peak=None):
+        with self.lock:
+            entry = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "peak_bytes": None})
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            if peak is not None and (entry["peak_bytes"] is None or peak > entry["peak_bytes"]):
+                entry["peak_bytes"] = peak
+
+    @contextmanager
+    def stage(self, name):
+        # Memory peaks are only meaningful on the main thread: tracemalloc's peak is process-wide
+        track_memory = self.trace_memory and threading.current_thread() is threading.main_thread()
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        frame = {"child_peak": 0}
+        if track_memory:
+            tracemalloc.reset_peak()
+        stack.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            stack.pop()
+            peak = None
+            if track_memory:
+                # Inner stages reset the peak, so fold their peaks back into this one
+                peak = max(tracemalloc.get_traced_memory()[1], frame["child_peak"])
+                if stack:
+                    stack[-1]["child_peak"] = max(stack[-1]["child_peak"], peak)
+                tracemalloc.reset_peak()
+            self._record(name, seconds, peak)
+
+    def summary(self):
+        wall_seconds = time.perf_counter() - self.started
+        return {
+            "wall_seconds": round(wall_seconds, 4),
+            "max_rss_mb": max_rss_mb(),
+            "stages": {
+                name: {
+                    "calls": entry["calls"],
+                    "seconds": round(entry["seconds"], 4),
+                    "mean_ms": round(entry["seconds"] / entry["calls"] * 1000, 4),
+                    "share": round(entry["seconds"] / wall_seconds, 4) if wall_seconds else None,
+                    "peak_mb": round(entry["peak_bytes"] / (1 << 20), 2) if entry["peak_bytes"] is not None else None,
+                }
+                for name, entry in sorted(self.stages.items(), key=lambda item: -item[1]["seconds"])
+            },
+            "notes": list(self.notes),
+        }
+
+    def report(self, json_path=None):
+        summary = self.summary()
+        rss = f"{summary['max_rss_mb']:.1f} MB" if summary["max_rss_mb"] is not None else "n/a"
+        print(f"\n[PROFILE] wall {summary['wall_seconds']:.2f}s, max RSS {rss}")
+        print(f"{'stage':<40} {'calls':>8} {'seconds':>9} {'mean ms':>9} {'share':>7} {'peak MB':>8}")
+        for name, entry in summary["stages"].items():
+            peak = f"{entry['peak_mb']:>8.2f}" if entry["peak_mb"] is not None else f"{'-':>8}"
+            print(f"{name:<40} {entry['calls']:>8} {entry['seconds']:>9.3f} {entry['mean_ms']:>9.3f} "
+                  f"{entry['share']:>7.1%} {peak}")
+        for message in summary["notes"]:
+            print(f"[PROFILE] Note: {message}")
+        if json_path:
+            with open(json_path, "w", encoding="utf-8") as json_file:
+                json.dump(summary, json_file, indent=2, ensure_ascii=False)
+            print(f"[PROFILE] Report written to {json_path}")
+        return summary
+
+
+def max_rss_mb():
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(max_rss / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def enable(trace_memory=True):
+    """
+    Start profiling in this process and return the profiler.
+    """
+    global _active
+    _active = StageProfiler(trace_memory)
+    return _active
+
+
+def active():
+    return _active
+
+
+def stage(name):
+    """
+    Context manager timing one named stage; a no-op unless profiling is enabled.
+    """
+    if _active is None:
+        return _null_context
+    return _active.stage(name)
+
+
+def note(message):
+    """
+    Add a note to the report, once; a no-op unless profiling is enabled.
+    """
+    if _active is not None and message not in _active.notes:
+        _active.notes.append(message)
+
+
+def iterate(name, iterable):
+    """
+    Yield from iterable, timing every next() call as the stage name.
+    """
+    if _active is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        with _active.stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
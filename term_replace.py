@@ -0,0 +1,83 @@
+"""
+Single-pass term replacement shared by 03_ocr.py (name_mapping) and tools/replace.py (replace.yml).
+
+All terms are compiled into one regex shaped like a trie of the terms, so matching costs
+about one trie walk per text position instead of one scan per term. At every position the
+longest term starting there wins, whatever the order of the mapping, and replaced text is
+never matched again.
+"""
+import re
+
+
+def _trie_pattern(node):
+    # node maps a character to its child node; the "" key marks the end of a term
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if "" in node:
+        # Greedy, so a longer term is tried before stopping at this shorter one
+        pattern = "(?:" + pattern + ")?"
+    return pattern
+
+
+def compile_terms(terms):
+    """
+    Compile terms into one regex matching the longest term at each position, or None if there are none.
+    """
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = True
+    if not trie:
+        return None
+    return re.compile(_trie_pattern(trie))
+
+
+class TermReplacer:
+    def __init__(self, mapping):
+        self.mapping = {str(term): str(replacement) for term, replacement in mapping.items() if str(term)}
+        self.pattern = compile_terms(self.mapping)
+        self.max_length = max(map(len, self.mapping), default=0)
+
+    def _substitute(self, match):
+        return self.mapping[match.group()]
+
+    def replace(self, text):
+        if self.pattern is None:
+            return text
+        return self.pattern.sub(self._substitute, text)
+
+    def replace_stream(self, chunks):
+        """
+        Replace terms in an iterable of text chunks, yielding the output piece by piece.
+        The last max_length - 1 characters of each chunk are held back, so terms spanning
+        two chunks are replaced exactly as in replace() on the whole text.
+        """
+        if self.pattern is None:
+            yield from chunks
+            return
+        hold = self.max_length - 1
+        pending = ""
+        for chunk in chunks:
+            pending += chunk
+            limit = len(pending) - hold
+            if limit <= 0:
+                continue
+            # Every match starting before limit is complete: no term can reach past the buffer
+            pieces = []
+            position = 0
+            for match in self.pattern.finditer(pending):
+                if match.start() >= limit:
+                    break
+                pieces.append(pending[position:match.start()])
+                pieces.append(self.mapping[match.group()])
+                position = match.end()
+            cut = max(position, limit)
+            pieces.append(pending[position:cut])
+            yield "".join(pieces)
+            pending = pending[cut:]
+        if pending:
+            yield self.replace(pending)
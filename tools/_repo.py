@@ -0,0 +1,31 @@
+"""
+Shared setup of the scripts in tools/. Importing it puts the repository root on sys.path;
+import_root() imports its helper modules (ocr_service, term_replace, translation, ...) and
+load_stage() loads the stage scripts, whose file names (02_frame.py, 03_ocr.py) are not
+importable.
+"""
+import importlib
+import importlib.util
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+def import_root(name):
+    """
+    Import the helper module name from the repository root.
+    """
+    return importlib.import_module(name)
+
+
+def load_stage(file_name, module_name):
+    """
+    Load the stage script file_name of the repository root as a module named module_name.
+    """
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
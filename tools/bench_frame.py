@@ -0,0 +1,313 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import cv2
+import ffmpeg
+import numpy as np
+
+from _repo import ROOT_DIR, load_stage
+
+
+def load_frame_module():
+    module = load_stage("02_frame.py", "frame")
+    module.KUROYURI_PATH = os.path.join(ROOT_DIR, "kuroyuri.png")
+    return module
+
+
+def plan_intervals(num_frames, fps, seed):
+    """
+    Deterministic ground truth: (first_frame, last_frame) ranges during which the icon is shown.
+    Gaps are always longer than GAP_DURATION_THRESHOLD so no two ranges get merged.
+    """
+    rng = np.random.default_rng(seed)
+    intervals = []
+    frame = int(fps)
+    while True:
+        length = int(rng.integers(int(fps), int(3 * fps)))
+        if frame + length >= num_frames - int(fps):
+            break
+        intervals.append((frame, frame + length - 1))
+        frame += length + int(rng.integers(int(0.5 * fps), int(1.5 * fps)))
+    return intervals
+
+
+def generate_video(frame_module, video_path, preset_key, width, height, num_frames, fps, seed, codec,
+                   weak_every=0):
+    """
+    Render a synthetic screen recording: a gradient background, a dialogue box whose text
+    changes with every line, and the kuroyuri icon composited at the preset region on the
+    ground-truth frame ranges (a mirrored, dimmed icon otherwise). With weak_every, every
+    weak_every-th line shows the icon with its top fifth inverted, so its similarity stays
+    well below THRESHOLD_RATIO of the peak but above the icon-off level.
+    """
+    preset = frame_module.CONFIG_PRESETS[preset_key]
+    (x1, y1, x2, y2), (x1_s, y1_s, x2_s, y2_s) = frame_module.preset_regions(preset, width, height)
+    reference = cv2.imread(frame_module.KUROYURI_PATH, cv2.IMREAD_GRAYSCALE)
+    icon = cv2.resize(reference, (x2 - x1, y2 - y1))
+    icon_on = cv2.cvtColor(icon, cv2.COLOR_GRAY2BGR)
+    icon_off = cv2.cvtColor((255 - icon[:, ::-1]) // 2 + 60, cv2.COLOR_GRAY2BGR)
+    icon_weak = icon_on.copy()
+    icon_weak[:icon.shape[0] // 5] = 255 - icon_weak[:icon.shape[0] // 5]
+
+    intervals = plan_intervals(num_frames, fps, seed)
+    line_of_frame = np.full(num_frames, -1)
+    for line, (first, last) in enumerate(intervals):
+        line_of_frame[first:last + 1] = line
+
+    background = np.full((height, width, 3), 60, np.uint8)
+    background[:, :, 0] = np.linspace(40, 200, width, dtype=np.uint8)[None, :]
+    background[y1_s:y2_s, x1_s:x2_s] = 230
+    font_scale = width / 1080 * 2
+
+    process = (
+        ffmpeg
+        .input("pipe:", format="rawvideo", pix_fmt="bgr24", s=f"{width}x{height}", r=fps)
+        .output(video_path, vcodec=codec, pix_fmt="yuv420p", g=int(2 * fps), loglevel="error")
+        .overwrite_output()
+        .run_async(pipe_stdin=True)
+    )
+    for frame_number in range(num_frames):
+        frame = background.copy()
+        line = line_of_frame[frame_number]
+        if line >= 0:
+            text = "".join(chr(65 + int(c)) for c in np.random.default_rng((seed, line)).integers(0, 26, 8))
+            cv2.putText(frame, text, (x1_s + 20, (y1_s + y2_s) // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                        font_scale, (0, 0, 0), max(1, int(font_scale * 2)))
+            frame[y1:y2, x1:x2] = icon_weak if weak_every and line % weak_every == weak_every - 1 else icon_on
+        else:
+            frame[y1:y2, x1:x2] = icon_off
+        process.stdin.write(frame.tobytes())
+    process.stdin.close()
+    process.wait()
+    return intervals
+
+
+def timed(function, frames):
+    started = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - started
+    return result, {"seconds": round(seconds, 4), "fps": round(frames / seconds, 1) if seconds else None}
+
+
+def benchmark_stages(frame_module, video_path, preset_key, width, height, fps):
+    """
+    Time each stage of the detection pipeline separately over the whole video.
+    """
+    preset = frame_module.CONFIG_PRESETS[preset_key]
+    roi, _ = frame_module.preset_regions(preset, width, height)
+    reference = cv2.imread(frame_module.KUROYURI_PATH, cv2.IMREAD_GRAYSCALE)
+    stages = {}
+
+    decode_seconds = {}
+    for decoder, backend in frame_module.DECODER_BACKENDS.items():
+        started = time.perf_counter()
+        frames = sum(1 for _ in backend(video_path, roi))
+        decode_seconds[decoder] = time.perf_counter() - started
+    for decoder, seconds in decode_seconds.items():
+        stages[f"decode_{decoder}"] = {"seconds": round(seconds, 4), "fps": round(frames / seconds, 1)}
+
+    # The per-pixel stages run on the OpenCV decoder's BGR regions, like the default path
+    areas = [area for area, _ in frame_module.read_roi_frames_opencv(video_path, roi)]
+    sharpened, stages["enhance_sharpness"] = timed(
+        lambda: [frame_module.enhance_sharpness(area) for area in areas], frames)
+    binaries, stages["binarize_image"] = timed(
+        lambda: [frame_module.binarize_image(area) for area in sharpened], frames)
+    _, stages["compute_similarity"] = timed(
+        lambda: [frame_module.compute_similarity(binary, reference) for binary in binaries], frames)
+
+    def engine_pass():
+        engine = frame_module.SimilarityEngine(reference)
+        similarities = []
+        for binary in binaries:
+            if engine.add(binary):
+                similarities.extend(engine.flush())
+        similarities.extend(engine.flush())
+        return np.array(similarities, dtype=np.float64)
+
+    similarities, stages["similarity_engine"] = timed(engine_pass, frames)
+
+    def gate_pass():
+        gate = frame_module.RoiChangeGate(frame_module.ROI_GATE_TOLERANCE)
+        for area in areas:
+            gate.unchanged(area)
+        return gate.hits
+
+    gate_hits, stages["roi_gate"] = timed(gate_pass, frames)
+    stages["roi_gate"]["hit_rate"] = round(gate_hits / frames, 4) if frames else None
+
+    intervals, stages["detect_intervals"] = timed(
+        lambda: frame_module.detect_intervals(similarities, similarities.max() * frame_module.THRESHOLD_RATIO, fps),
+        frames)
+    return frames, stages, intervals
+
+
+def check_intervals(expected, detected, fps):
+    """
+    Compare detected (start_seconds, end_seconds) intervals with the ground-truth frame ranges.
+    """
+    detected_frames = [(round(start * fps), round(end * fps)) for start, end in detected]
+    mismatches = []
+    for i in range(max(len(expected), len(detected_frames))):
+        truth = expected[i] if i < len(expected) else None
+        found = detected_frames[i] if i < len(detected_frames) else None
+        if truth != found:
+            mismatches.append({"expected": truth and list(truth), "detected": found and list(found)})
+    return {"expected": len(expected), "detected": len(detected), "match": not mismatches,
+            "mismatches": mismatches[:10]}
+
+
+def benchmark_end_to_end(frame_module, video_path, options):
+    """
+    Time one full extract_frames run without the trace cache.
+    """
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = frame_module.extract_frames(video_path, debug=False, use_cache=False, **options)
+    seconds = time.perf_counter() - started
+    frames = stats["frames"] if stats else 0
+    return {"options": options, "seconds": round(seconds, 4),
+            "fps": round(frames / seconds, 1) if seconds else None,
+            "intervals": stats["intervals"] if stats else None}
+
+
+def read_slide_set(slides_dir):
+    return {name: cv2.imread(os.path.join(slides_dir, name)) for name in sorted(os.listdir(slides_dir))
+            if name.endswith(".png")}
+
+
+def check_stream_slides(frame_module, video_path, threshold, expected):
+    """
+    Run batch and streaming mode with the same absolute threshold and compare their slides:
+    both must write one slide per ground-truth interval, with identical names and pixels.
+    """
+    slides_dir = os.path.splitext(video_path)[0] + "-slides"
+    with contextlib.redirect_stdout(io.StringIO()):
+        frame_module.extract_frames(video_path, debug=False, slides=True, enable_merge=False, generate_ass=False,
+                                    use_cache=False, threshold=threshold)
+    batch_slides = read_slide_set(slides_dir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        frame_module.extract_frames_streaming(video_path, debug=False, slides=True, generate_ass=False,
+                                              threshold=threshold)
+    stream_slides = read_slide_set(slides_dir)
+    differing = sorted(name for name in set(batch_slides) | set(stream_slides)
+                       if name not in batch_slides or name not in stream_slides
+                       or not np.array_equal(batch_slides[name], stream_slides[name]))
+    return {"threshold": threshold, "expected": len(expected), "batch": len(batch_slides),
+            "stream": len(stream_slides), "differing": differing[:10],
+            "match": not differing and len(batch_slides) == len(expected)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the 02_frame.py detection pipeline on synthetic videos.")
+    parser.add_argument("--output", default="bench_frame.json", help="Path of the JSON result file.")
+    parser.add_argument("--baseline", default=None, help="Earlier JSON result to compare the stage speeds with.")
+    parser.add_argument("--frames", type=int, default=1800, help="Number of frames per synthetic video.")
+    parser.add_argument("--fps", type=int, default=30, help="Frame rate of the synthetic videos.")
+    parser.add_argument("--scale", type=float, default=0.5,
+                        help="Resolution relative to 1080x1920 / 1080x2340 (1 for full size).")
+    parser.add_argument("--codec", default="libx264", help="ffmpeg video encoder for the synthetic videos.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the ground-truth intervals.")
+    parser.add_argument("--workdir", default=None, help="Keep the synthetic videos in this directory.")
+    parser.add_argument("--stream-threshold", type=float, default=0.5,
+                        help="Absolute threshold of the batch/streaming slide comparison, on a video whose "
+                             "every third line has a weak icon.")
+    args = parser.parse_args()
+
+    frame_module = load_frame_module()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_frame_")
+    os.makedirs(workdir, exist_ok=True)
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "settings": {"frames": args.frames, "fps": args.fps, "scale": args.scale, "codec": args.codec,
+                     "seed": args.seed},
+        "presets": {},
+    }
+    try:
+        for preset_key, preset in frame_module.CONFIG_PRESETS.items():
+            # Even dimensions keep yuv420p happy
+            width = int(preset["DEFAULT_WIDTH"] * args.scale) // 2 * 2
+            height = int(preset["DEFAULT_HEIGHT"] * args.scale) // 2 * 2
+            video_path = os.path.join(workdir, f"bench_{preset_key}.mp4")
+            print(f"[{preset_key}] Generating {width}x{height}, {args.frames} frames at {args.fps} fps")
+            expected = generate_video(frame_module, video_path, preset_key, width, height, args.frames, args.fps,
+                                      args.seed, args.codec)
+
+            print(f"[{preset_key}] Timing stages")
+            frames, stages, detected = benchmark_stages(frame_module, video_path, preset_key, width, height,
+                                                        args.fps)
+            ground_truth = check_intervals(expected, detected, args.fps)
+            end_to_end = [benchmark_end_to_end(frame_module, video_path, options) for options in (
+                {"slides": False, "enable_merge": False, "generate_ass": False},
+                {"slides": True, "enable_merge": True, "generate_ass": True},
+                {"slides": False, "enable_merge": False, "generate_ass": False, "decoder": "ffmpeg"},
+            )]
+            for run in end_to_end:
+                run["match"] = run["intervals"] == len(expected)
+
+            weak_path = os.path.join(workdir, f"bench_{preset_key}_weak.mp4")
+            print(f"[{preset_key}] Comparing batch and streaming slides at threshold {args.stream_threshold}")
+            weak_expected = generate_video(frame_module, weak_path, preset_key, width, height, args.frames,
+                                           args.fps, args.seed, args.codec, weak_every=3)
+            stream_check = check_stream_slides(frame_module, weak_path, args.stream_threshold, weak_expected)
+            results["presets"][preset_key] = {
+                "size": [width, height], "frames": frames, "stages": stages,
+                "end_to_end": end_to_end, "ground_truth": ground_truth, "stream_slides": stream_check,
+            }
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir)
+
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)["presets"]
+
+    failed = False
+    for preset_key, result in results["presets"].items():
+        truth = result["ground_truth"]
+        stream_check = result["stream_slides"]
+        failed |= (not truth["match"] or not all(run["match"] for run in result["end_to_end"])
+                   or not stream_check["match"])
+        print(f"\n[{preset_key}] {result['size'][0]}x{result['size'][1]}, {result['frames']} frames, "
+              f"intervals {truth['detected']}/{truth['expected']} {'OK' if truth['match'] else 'MISMATCH'}")
+        print(f"batch/stream slides at threshold {stream_check['threshold']}: {stream_check['batch']}/"
+              f"{stream_check['stream']} of {stream_check['expected']} "
+              f"{'OK' if stream_check['match'] else 'MISMATCH ' + ', '.join(stream_check['differing'])}")
+        print(f"{'stage':>20} {'seconds':>9} {'fps':>10}" + (f" {'vs base':>8}" if baseline else ""))
+        rows = list(result["stages"].items()) + [
+            ("end_to_end" + ("+slides" if run["options"].get("slides") else "")
+             + (f"+{run['options']['decoder']}" if "decoder" in run["options"] else ""), run)
+            for run in result["end_to_end"]]
+        for name, stage in rows:
+            line = f"{name:>20} {stage['seconds']:>9.3f} {stage['fps']:>10.1f}"
+            if baseline:
+                base_stage = baseline.get(preset_key, {}).get("stages", {}).get(name)
+                if base_stage is None:
+                    base_stage = next((run for run in baseline.get(preset_key, {}).get("end_to_end", [])
+                                       if run["options"] == stage.get("options")), None)
+                if base_stage and base_stage.get("fps"):
+                    line += f" {stage['fps'] / base_stage['fps']:>7.2f}x"
+            print(line)
+    print(f"\nResults written to {args.output}")
+    if failed:
+        print("Error: Detected intervals or slides do not match the ground truth.")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import time
+
+import cv2
+import numpy as np
+
+from _repo import load_stage
+
+
+def load_ocr_module():
+    return load_stage("03_ocr.py", "ocr_stage")
+
+
+def list_slides(slides_path, limit):
+    slides = [(int(name[:-4]), os.path.join(slides_path, name)) for name in sorted(os.listdir(slides_path))
+              if name.endswith(".png") and name[:-4].isdigit()]
+    return slides[:limit] if limit else slides
+
+
+def full_ocr_lines(ocr, image_path, cls):
+    # Texts kept by one full detection + recognition call, as the original 03_ocr.py read slides
+    result = ocr.ocr(image_path, cls=cls)
+    return [word_info[1][0] for line in result if line for word_info in line]
+
+
+def run_baseline(ocr_module, ocr, slides):
+    """
+    The original two full ocr.ocr() calls per slide (with and without the angle classifier),
+    formatted like the other paths. Returns the texts and the number of lines read per slide.
+    """
+    texts, line_counts = {}, {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for seq, image_path in slides:
+            extracted_lines = full_ocr_lines(ocr, image_path, True)
+            line_counts[seq] = len(extracted_lines)
+            texts[seq] = (ocr_module.format_extracted_text(seq, extracted_lines,
+                                                           full_ocr_lines(ocr, image_path, False))[0]
+                          if extracted_lines else "")
+    return texts, line_counts
+
+
+def kept_line_count(ocr_module, lines):
+    return sum(score >= ocr_module.OCR_OPTIONS["drop_score"] for _, score in lines["cls"])
+
+
+def run_per_image(ocr_module, ocr, slides):
+    texts, line_counts = {}, {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for seq, lines in ocr_module.read_slides(ocr, slides):
+            texts[seq] = ocr_module.format_slide(seq, lines)[0]
+            line_counts[seq] = kept_line_count(ocr_module, lines)
+    return texts, line_counts
+
+
+def run_batched(ocr_module, ocr, slides, batch_size):
+    texts, line_counts = {}, {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for seq, lines in ocr_module.read_slides_batched(ocr, slides, batch_size):
+            texts[seq] = ocr_module.format_slide(seq, lines)[0]
+            line_counts[seq] = kept_line_count(ocr_module, lines)
+    return texts, line_counts
+
+
+def check_layout_edge_ink(ocr_module):
+    """
+    Split a synthetic 9:16 slide with --layout: a dialogue line shares its rows with a blob
+    touching the right edge, where the kuroyuri icon sits. The line must get exactly one crop
+    holding all of its ink and none of the blob's. Returns a list of problems (empty if OK).
+    """
+    height, width = 320, 880
+    text = np.full((height, width, 3), 255, np.uint8)
+    cv2.putText(text, "dialogue line beside the icon", (40, 250), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 0), 3)
+    slide = text.copy()
+    slide[209:266, 862:width] = 0
+    crops = ocr_module.split_text_lines(slide)
+    if len(crops) != 1:
+        return [f"{len(crops)} text lines split instead of 1"]
+    text_ink = np.count_nonzero(text[..., 0] < 128)
+    crop_ink = np.count_nonzero(crops[0][..., 0] < 128)
+    if crop_ink != text_ink:
+        return [f"The line crop holds {crop_ink} ink pixels instead of the {text_ink} of the line"]
+    return []
+
+
+def benchmark(name, run, slides, reference=None):
+    """
+    Time one recognition path over all slides. Against the reference (the original full
+    ocr.ocr() path), agreement is the share of slides whose text matches exactly, and
+    missing_lines lists the slides where fewer text lines were read.
+    """
+    started = time.perf_counter()
+    texts, line_counts = run()
+    seconds = time.perf_counter() - started
+    result = {"name": name, "seconds": round(seconds, 3),
+              "slides_per_second": round(len(slides) / seconds, 2) if seconds else None}
+    if reference is not None:
+        reference_texts, reference_counts = reference
+        same = sum(texts.get(seq) == text for seq, text in reference_texts.items())
+        result["agreement"] = round(same / len(reference_texts), 4) if reference_texts else None
+        result["missing_lines"] = [seq for seq, count in reference_counts.items() if line_counts.get(seq, 0) < count]
+    return result, (texts, line_counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the original full-OCR, per-image and batched recognition "
+                                                 "throughput of 03_ocr.py.")
+    parser.add_argument("--slides", required=True, help="Slides folder written by 02_frame.py --slides.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[6, 16, 32, 64],
+                        help="Recognition batch sizes (text lines per forward pass) to time.")
+    parser.add_argument("--limit", type=int, default=0, help="Only use the first N slides (0: all).")
+    parser.add_argument("--output", default="bench_ocr.json", help="Path of the JSON result file.")
+    args = parser.parse_args()
+
+    ocr_module = load_ocr_module()
+    slides = list_slides(args.slides, args.limit)
+    if not slides:
+        print(f"Error: No slides found in {args.slides}")
+        raise SystemExit(1)
+    layout_problems = check_layout_edge_ink(ocr_module)
+    print(f"Layout split beside an edge blob: {'; '.join(layout_problems) or 'OK'}")
+
+    runs = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        ocr = ocr_module.create_ocr()
+        # The first inference initializes the predictors, keep it out of the timings
+        ocr_module.extract_text_from_image(slides[0][1], ocr, slides[0][0])
+    print(f"Timing the original full OCR of {len(slides)} slides")
+    result, reference = benchmark("baseline", lambda: run_baseline(ocr_module, ocr, slides), slides)
+    runs.append(result)
+    print("Timing per-image recognition")
+    result, _ = benchmark("per-image", lambda: run_per_image(ocr_module, ocr, slides), slides, reference)
+    runs.append(result)
+
+    for batch_size in args.batch_sizes:
+        with contextlib.redirect_stdout(io.StringIO()):
+            ocr = ocr_module.create_ocr(batch_size)
+            run_batched(ocr_module, ocr, slides[:1], batch_size)
+        print(f"Timing batched recognition, {batch_size} lines per batch")
+        result, _ = benchmark(f"batch-{batch_size}", lambda: run_batched(ocr_module, ocr, slides, batch_size),
+                              slides, reference)
+        runs.append(result)
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "slides": len(slides),
+        "layout_edge_ink": layout_problems,
+        "runs": runs,
+    }
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=2)
+
+    base = runs[0]["seconds"]
+    print(f"\n{'path':>12} {'seconds':>9} {'slides/s':>9} {'speedup':>8} {'agreement':>10} {'missing':>8}")
+    for run in runs:
+        speedup = f"{base / run['seconds']:>7.2f}x" if run["seconds"] else f"{'-':>8}"
+        agreement = f"{run['agreement']:>10.1%}" if run.get("agreement") is not None else f"{'-':>10}"
+        missing = f"{len(run['missing_lines']):>8}" if "missing_lines" in run else f"{'-':>8}"
+        print(f"{run['name']:>12} {run['seconds']:>9.3f} {run['slides_per_second'] or 0:>9.2f} {speedup} {agreement} "
+              f"{missing}")
+    print(f"\nResults written to {args.output}")
+
+    incomplete = [run for run in runs if run.get("missing_lines")]
+    for run in incomplete:
+        print(f"Error: {run['name']} read fewer text lines than the original OCR on slides {run['missing_lines']}")
+    if layout_problems:
+        print("Error: --layout lost or polluted a text line next to ink touching the slide edge")
+    if incomplete or layout_problems:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
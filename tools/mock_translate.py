@@ -0,0 +1,141 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from _repo import import_root
+
+translation = import_root("translation")
+
+
+class MockMyMemoryHandler(BaseHTTPRequestHandler):
+    """
+    Answers GET /get?q=...&langpair=ja|zh like the MyMemory API, with "[zh] " + q as the
+    translation, after the configured latency. A share of the requests fails with HTTP
+    429 or 500 so the retries of the client get exercised.
+    """
+    protocol_version = "HTTP/1.1"  # Keep-alive, so pooled connections are reused
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        time.sleep(server.latency)
+        if url.path != "/get" or "q" not in query:
+            self._reply(404, {"responseStatus": 404, "responseDetails": "NOT FOUND"})
+        elif server.random.random() < server.error_rate:
+            with server.lock:
+                server.errors += 1
+            self._reply(server.random.choice((429, 500)), {"responseStatus": 429, "responseDetails": "MOCK ERROR"})
+        else:
+            self._reply(200, {"responseData": {"translatedText": "[zh] " + query["q"][0], "match": 1},
+                              "responseStatus": 200, "matches": []})
+
+    def _reply(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port, latency, error_rate, seed):
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockMyMemoryHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.random = random.Random(seed)
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.errors = 0
+    server.connections = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def reset_counters(server):
+    with server.lock:
+        server.requests = 0
+        server.errors = 0
+        server.connections = set()
+
+
+def translate_per_line(url, lines):
+    # What the translate package did: one request on a new connection per line, one after another
+    translations = []
+    for line in lines:
+        for attempt in range(4):
+            response = requests.get(url, params={"q": line, "langpair": "ja|zh"})
+            if response.status_code == 200:
+                break
+            time.sleep(0.1 * 2 ** attempt)
+        translations.append(response.json()["responseData"]["translatedText"])
+    return translations
+
+
+def translate_pooled(url, lines, workers, rate):
+    client = translation.TranslationClient(url, workers=workers, rate=rate, backoff=0.1)
+    try:
+        futures = [client.submit(line) for line in lines]
+        return [future.result() for future in futures]
+    finally:
+        client.close()
+
+
+def run_bench(server, url, lines, workers, rate):
+    runs = [("per-line", lambda: translate_per_line(url, lines))]
+    runs += [(f"pooled x{count}", lambda count=count: translate_pooled(url, lines, count, rate)) for count in workers]
+    print(f"{'client':>12} {'seconds':>8} {'lines/s':>8} {'requests':>9} {'errors':>7} {'connections':>12}")
+    expected = ["[zh] " + line for line in lines]
+    for name, run in runs:
+        reset_counters(server)
+        started = time.perf_counter()
+        translations = run()
+        seconds = time.perf_counter() - started
+        status = "" if translations == expected else "  MISMATCH"
+        print(f"{name:>12} {seconds:>8.2f} {len(lines) / seconds:>8.1f} {server.requests:>9} {server.errors:>7} "
+              f"{len(server.connections):>12}{status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MyMemory-compatible mock translation server for offline runs.")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (127.0.0.1).")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before each response.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429/500.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the simulated errors.")
+    parser.add_argument("--bench", type=int, default=0, metavar="LINES",
+                        help="Instead of serving, translate LINES lines per-line and pooled and print timings.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[4, 8], help="Pool sizes to time with --bench.")
+    parser.add_argument("--rate", type=float, default=0.0, help="Request rate limit to time with --bench (0: none).")
+    args = parser.parse_args()
+
+    server = start_server(args.port, args.latency, args.error_rate, args.seed)
+    url = f"http://127.0.0.1:{server.server_address[1]}/get"
+    if args.bench:
+        run_bench(server, url, [f"テスト{i}行目のセリフ" for i in range(args.bench)], args.workers, args.rate)
+        server.shutdown()
+        return
+
+    print(f"Mock translation server at {url} (use 03_ocr.py --chn --translate-url {url}), Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(f"\n{server.requests} requests served, {server.errors} simulated errors")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,13 @@ import argparse
 import yaml
 import os
 
+from _repo import import_root
+
+TermReplacer = import_root("term_replace").TermReplacer
+
+# Characters read from the input at a time
+CHUNK_SIZE = 1 << 20
+
 
 def load_replacements(config_path='replace.yml'):
     config_path = os.path.join(os.path.dirname(__file__), 'replace.yml')
@@ -11,9 +18,15 @@ def load_replacements(config_path='replace.yml'):
 
 
 def replace_text(text, replacements):
-    for src, dst in replacements.items():
-        text = text.replace(src, dst)
-    return text
+    return TermReplacer(replacements).replace(text)
+
+
+def read_chunks(f, chunk_size=CHUNK_SIZE):
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
 
 
 def main():
@@ -26,20 +39,18 @@ def main():
         print(f"Input file not found: {input_path}")
         return
 
-    with open(input_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    replacements = load_replacements()
-    new_content = replace_text(content, replacements)
+    replacer = TermReplacer(load_replacements() or {})
 
     base, ext = os.path.splitext(input_path)
     output_path = f"{base}-new{ext}"
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(new_content)
+    # Stream the file through the replacer so large inputs are never held in memory whole
+    with open(input_path, 'r', encoding='utf-8') as f, open(output_path, 'w', encoding='utf-8') as out:
+        for piece in replacer.replace_stream(read_chunks(f)):
+            out.write(piece)
 
     print(f"Replaced content written to: {output_path}")
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
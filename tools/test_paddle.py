@@ -1,7 +1,24 @@
 import sys
-from paddleocr import PaddleOCR
+
+from _repo import import_root
+
+ocr_service = import_root("ocr_service")
+
+
+def recognize_with_service(service, image_path):
+    # 使用已启动的 OCR 服务（python 03_ocr.py --serve），无需重新加载模型
+    (_, lines), = service.read_slides([(0, image_path)])
+    if not lines["cls"]:
+        print("未能识别出任何文本。")
+        return
+    print("识别结果（OCR 服务）：")
+    for text, confidence in lines["cls"]:
+        print(f"文本: {text} | 置信度: {confidence:.2f}")
+
 
 def recognize_text(image_path):
+    from paddleocr import PaddleOCR
+
     # 初始化 OCR，指定语言为日语（japan）
     ocr = PaddleOCR(use_angle_cls=True, lang="japan")
     
@@ -26,4 +43,11 @@ if __name__ == "__main__":
         sys.exit(1)
     
     image_path = sys.argv[1]
-    recognize_text(image_path)
\ No newline at end of file
+    service = ocr_service.connect()
+    if service is not None:
+        try:
+            recognize_with_service(service, image_path)
+        finally:
+            service.close()
+    else:
+        recognize_text(image_path)
@@ -0,0 +1,95 @@
+"""
+Japanese-to-Chinese translation client shared by 03_ocr.py and 02_frame.py --ocr --chn.
+
+It speaks the MyMemory API (the default provider of the `translate` package used before)
+over one pooled requests.Session. Lines are sent concurrently from a thread pool, at most
+`rate` requests per second, and failed requests are retried with exponential backoff.
+MyMemory takes a single text per request, so lines are not batched together.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from textwrap import wrap
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import stage_profiler
+
+MYMEMORY_URL = "http://api.mymemory.translated.net/get"
+# Longest text sent in one request; longer lines are split like the translate package does
+MAX_REQUEST_LENGTH = 1000
+# Status codes worth retrying: rate limited or a transient server error
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TranslationClient:
+    def __init__(self, url=MYMEMORY_URL, workers=4, rate=4.0, retries=3, backoff=1.0, timeout=30,
+                 from_lang="ja", to_lang="zh"):
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.langpair = f"{from_lang}|{to_lang}"
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = 0.0
+        self.slot_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="translate")
+        self.requests = 0
+        self.failures = 0
+
+    def _wait_for_slot(self):
+        # Space request starts interval seconds apart across all threads
+        with self.slot_lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+            self.requests += 1
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _request(self, text):
+        for attempt in range(self.retries + 1):
+            self._wait_for_slot()
+            try:
+                with stage_profiler.stage("translation.request"):
+                    response = self.session.get(self.url, params={"q": text, "langpair": self.langpair},
+                                                timeout=self.timeout)
+                    if response.status_code in RETRY_STATUS:
+                        raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+                    response.raise_for_status()
+                    data = response.json()
+                translation = data["responseData"]["translatedText"]
+                if not translation:
+                    translation = next(match["translation"] for match in data["matches"])
+                return translation
+            except (requests.RequestException, ValueError, KeyError, StopIteration) as e:
+                with self.slot_lock:
+                    self.failures += 1
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                print(f"[WARNING] Translation request failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def translate(self, text):
+        """
+        Translate one text on the calling thread.
+        """
+        if not text:
+            return ""
+        return " ".join(self._request(chunk) for chunk in wrap(text, MAX_REQUEST_LENGTH, replace_whitespace=False))
+
+    def submit(self, text):
+        """
+        Translate one text on the pool; returns a Future of the translation.
+        """
+        return self.executor.submit(self.translate, text)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()